@@ -1,130 +1,2548 @@
 __version__ = "1.0.0" # Change this to the current version of your project
+# Defaults for the user's preferences. Changes made by the user are stored in the settings file instead
 _IGNOREVERSION = None
 _UPDATECHECKING = True
 
+# Only lightweight modules are imported here, so importing this module costs next to nothing when update
+# checking is disabled. The http stack (requests, or urllib if requests is not installed), asyncio and
+# concurrent.futures are imported when they are first used
 import os
 import sys
-import re
-import requests
+import json
+import time
+import contextlib
+from collections import namedtuple
+
+# Like typing.TYPE_CHECKING (type checkers treat it as True), without importing typing at runtime
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Awaitable, Callable
+    from concurrent.futures import Future
+    import asyncio
+    import aiohttp
+
+
+def _loadrequests():
+    """
+    Utility function to import requests the first time an http request is made
+    If requests is not installed, returns None (urllib is used instead)
+    """
+    global requests
+    if "requests" not in globals():
+        try:
+            import requests
+        except ImportError:
+            requests = None
+    return requests
+
+
+def _requesterror(message: str) -> OSError:
+    """
+    Utility function to make the exception raised when an http request fails
+    This is a requests.exceptions.RequestException if requests is installed, or a plain OSError if it is not
+    (both are caught by except OSError)
+    """
+    if _loadrequests() is not None:
+        return requests.exceptions.RequestException(message)
+    return OSError(message)
+
+
+def _parseretryafter(value: str) -> float:
+    """
+    Utility function to get the number of seconds a Retry-After header asks to wait
+    If value is missing or malformed, returns None
+
+    :param value: The header's value, either a number of seconds or an http date
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    from email.utils import parsedate_to_datetime
+    try:
+        retryat = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if retryat is None:
+        return None
+    return max(0.0, retryat.timestamp() - time.time())
+
+
+def _acceptencoding() -> str:
+    """
+    Utility function to get the Accept-Encoding header the urllib fallback advertises:
+    gzip and deflate, and brotli if a brotli package is installed
+    """
+    import importlib.util
+    if importlib.util.find_spec("brotli") or importlib.util.find_spec("brotlicffi"):
+        return "gzip, deflate, br"
+    return "gzip, deflate"
+
+
+def _decompressor(contentencoding: str):
+    """
+    Utility function to get an object that decompresses a response body a chunk at a time, with
+    decompress(chunk) and flush() methods like a zlib decompressobj
+    If the body is not compressed (or is compressed with an unsupported encoding), returns None
+
+    :param contentencoding: The response's Content-Encoding header
+    """
+    contentencoding = (contentencoding or "").strip().lower()
+    if contentencoding in ("gzip", "x-gzip", "deflate"):
+        import zlib
+        # 32 + MAX_WBITS accepts both gzip and zlib headers
+        return zlib.decompressobj(32 + zlib.MAX_WBITS)
+    if contentencoding == "br":
+        try:
+            import brotli
+        except ImportError:
+            try:
+                import brotlicffi as brotli
+            except ImportError:
+                return None
+        from types import SimpleNamespace
+        decompressor = brotli.Decompressor()
+        decompress = getattr(decompressor, "decompress", None) or decompressor.process
+        return SimpleNamespace(decompress=decompress, flush=lambda: b"")
+    return None
+
+
+class _UrllibResponse:
+    def __init__(self, response):
+        """
+        Initializes urllibresponse class.
+        Wraps a urllib response in the subset of the requests.Response interface used by this module.
+        Compressed bodies are decompressed as they are read.
+
+        :param response: http.client.HTTPResponse or urllib.error.HTTPError
+        """
+        self.raw = response
+        self.status_code = response.status if getattr(response, "status", None) is not None else response.code
+        self.headers = response.headers
+        self.encoding = response.headers.get_content_charset()
+        self._decompressor = _decompressor(response.headers.get("Content-Encoding"))
+        self._content = None
+
+    @property
+    def content(self) -> bytes:
+        if self._content is None:
+            self._content = b"".join(self.iter_content(64 * 1024))
+            self.raw.close()
+        return self._content
+
+    @property
+    def text(self) -> str:
+        return self.content.decode(self.encoding or "utf-8", errors="replace")
+
+    def _read(self, chunk_size: int) -> bytes:
+        chunk = self.raw.read(chunk_size)
+        # http.client returns what arrived, instead of raising, if the connection is closed partway through
+        if not chunk and getattr(self.raw, "length", None):
+            raise OSError(f"Connection closed with {self.raw.length} bytes of the response left to read")
+        return chunk
+
+    def iter_content(self, chunk_size: int=1):
+        if self._content is not None:
+            yield self._content
+            return
+        if self._decompressor is None:
+            yield from iter(lambda: self._read(chunk_size), b"")
+            return
+        for chunk in iter(lambda: self._read(chunk_size), b""):
+            chunk = self._decompressor.decompress(chunk)
+            if chunk:
+                yield chunk
+        chunk = self._decompressor.flush()
+        if chunk:
+            yield chunk
+
+    def close(self) -> None:
+        self.raw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _UrllibSession:
+    def __init__(self):
+        """
+        Initializes urllibsession class.
+        Makes http requests with urllib, in the subset of the requests.Session interface used by this module.
+        Used when requests is not installed. Connections are not pooled.
+        """
+        self.headers = {"Accept-Encoding": _acceptencoding()}
+
+    def get(self, link: str, headers: dict=None, timeout: float=None, stream: bool=False) -> _UrllibResponse:
+        import urllib.error
+        import urllib.request
+        if isinstance(timeout, tuple):
+            # urllib has a single timeout for connecting and for each read
+            timeout = max(timeout)
+        request = urllib.request.Request(link, headers={**self.headers, **(headers or {})})
+        try:
+            response = urllib.request.urlopen(request, timeout=timeout)
+        except urllib.error.HTTPError as err:
+            # Responses with error status codes (and 304 Not Modified) are returned rather than raised, like requests
+            response = err
+        response = _UrllibResponse(response)
+        if not stream:
+            response.content
+        return response
+
+    def close(self) -> None:
+        pass
+
+
+def _defaultcachedir() -> str:
+    """
+    Utility function to get the per-user cache directory used by PythonAutoUpdate
+    """
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~\\AppData\\Local")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "PythonAutoUpdate")
+
+
+def _defaultconfigdir() -> str:
+    """
+    Utility function to get the per-user config directory used by PythonAutoUpdate
+    """
+    if os.name == "nt":
+        base = os.environ.get("APPDATA") or os.path.expanduser("~\\AppData\\Roaming")
+    else:
+        base = os.environ.get("XDG_CONFIG_HOME") or os.path.expanduser("~/.config")
+    return os.path.join(base, "PythonAutoUpdate")
+
+
+def _defaultfile(scriptname: str, key: str, suffix: str) -> str:
+    """
+    Utility function to get the default path of a per-script file in the user's PythonAutoUpdate config directory
+    The file is named after scriptname and a hash of key, so scripts that share a file name do not share the file
+
+    :param scriptname: The name of the script
+    :param key: What identifies the script, like its check link or its absolute path
+    :param suffix: Suffix of the file name, like "state.json"
+    """
+    import hashlib
+    keyhash = hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(_defaultconfigdir(), f"{scriptname}.{keyhash}.{suffix}")
+
+
+def _timedfsync(fd: int, timings: dict=None) -> None:
+    """
+    Utility function to fsync a file descriptor, adding the number of seconds it took to timings["fsync"]
+    """
+    start = time.perf_counter()
+    try:
+        os.fsync(fd)
+    finally:
+        if timings is not None:
+            timings["fsync"] = timings.get("fsync", 0) + time.perf_counter() - start
+
+
+def _renameover(temppath: str, path: str, timings: dict=None) -> None:
+    """
+    Utility function to atomically rename a written and fsynced file over path (in the same directory),
+    keeping the permissions of the file being replaced, and persist the rename itself
+    """
+    try:
+        # Keep the permissions of the file being replaced (mkstemp creates files only the owner can read)
+        os.chmod(temppath, os.stat(path).st_mode & 0o7777)
+    except OSError:
+        pass
+    os.replace(temppath, path)
+    if hasattr(os, "O_DIRECTORY"):
+        # Persist the rename itself
+        try:
+            dirfd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY | os.O_DIRECTORY)
+        except OSError:
+            return
+        try:
+            _timedfsync(dirfd, timings)
+        except OSError:
+            pass
+        finally:
+            os.close(dirfd)
+
+
+def _commitfile(temppath: str, path: str, timings: dict=None) -> None:
+    """
+    Utility function to atomically replace path with a fully written file in the same directory
+    The file is fsynced and renamed over path, so readers see either the old or the new contents
+
+    :param temppath: Path of the written file
+    :param path: Path of the file to replace
+    :param timings: Dict to store the number of seconds spent in fsync in, under "fsync"
+    """
+    with open(temppath, 'rb+') as f:
+        _timedfsync(f.fileno(), timings)
+    _renameover(temppath, path, timings)
+
+
+@contextlib.contextmanager
+def _atomicreplace(path: str, timings: dict=None):
+    """
+    Utility context manager to replace a file atomically
+    Yields a binary file object for a temporary file in the same directory. When the block exits, the temporary
+    file is fsynced and renamed over path, so readers see either the old or the new contents and never a
+    partially written file. If the block raises, path is left untouched
+
+    :param path: Path of the file to replace
+    :param timings: Dict to store the number of seconds spent in fsync in, under "fsync"
+    """
+    import tempfile
+    path = os.path.abspath(path)
+    fd, temppath = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    os.close(fd)
+    try:
+        with open(temppath, 'wb') as f:
+            yield f
+            f.flush()
+            _timedfsync(f.fileno(), timings)
+        _renameover(temppath, path, timings)
+    except BaseException:
+        try:
+            os.remove(temppath)
+        except OSError:
+            pass
+        raise
+
+
+def _atomicwrite(path: str, data: bytes) -> None:
+    """
+    Utility function to write a file atomically
+
+    :param path: Path of the file to write
+    :param data: Contents to write
+    """
+    with _atomicreplace(path) as f:
+        f.write(data)
+
+
+def _filedigest(path: str, chunksize: int=64 * 1024) -> str:
+    """
+    Utility function to get the sha256 hex digest of a file without reading it all into memory
+    """
+    import hashlib
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunksize), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class IntegrityError(Exception):
+    """
+    Raised when a manifest or a downloaded file fails verification
+    """
+
+
+def _verifysignature(manifest: dict, publickey: str) -> None:
+    """
+    Utility function to verify the signature of a manifest
+    The signature is a base64 encoded Ed25519 signature of the manifest's other fields, serialized as json with
+    sorted keys and no whitespace. Requires the cryptography package
+
+    :param manifest: Parsed manifest
+    :param publickey: Base64 encoded raw Ed25519 public key the manifest must be signed with
+    :raises IntegrityError: If the signature is missing or invalid
+    """
+    try:
+        from cryptography.exceptions import InvalidSignature
+        from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PublicKey
+    except ImportError:
+        raise IntegrityError("The cryptography package is required to verify manifest signatures") from None
+    import base64
+    if not manifest.get("signature"):
+        raise IntegrityError("Manifest is not signed")
+    payload = json.dumps({key: value for key, value in manifest.items() if key != "signature"},
+                         sort_keys=True, separators=(",", ":")).encode("utf-8")
+    try:
+        Ed25519PublicKey.from_public_bytes(base64.b64decode(publickey)).verify(
+            base64.b64decode(manifest["signature"]), payload)
+    except (InvalidSignature, ValueError):
+        raise IntegrityError("Manifest signature is invalid") from None
+
+
+def _parsemanifest(text: str, publickey: str=None) -> dict:
+    """
+    Utility function to parse and validate a manifest
+
+    :param text: Manifest json (or toml, on python 3.11 and newer)
+    :param publickey: Base64 encoded Ed25519 public key the manifest must be signed with.
+    If publickey is None, the signature is not checked
+    :raises IntegrityError: If the manifest is malformed or its signature is invalid
+    """
+    try:
+        manifest = json.loads(text)
+    except ValueError as err:
+        try:
+            import tomllib
+        except ImportError:
+            raise IntegrityError(f"Manifest is not valid json: {err}") from None
+        try:
+            manifest = tomllib.loads(text)
+        except ValueError:
+            raise IntegrityError("Manifest is neither valid json nor valid toml") from None
+    if not isinstance(manifest, dict):
+        raise IntegrityError("Manifest is not a json object")
+    for key, kind in (("version", str), ("whatsnew", str), ("sha256", str), ("size", int),
+                      ("scriptlink", (str, list)), ("deltas", dict), ("files", dict), ("baselink", str)):
+        if key in manifest and not isinstance(manifest[key], kind):
+            raise IntegrityError(f"Manifest field {key} has the wrong type")
+    if publickey is not None:
+        _verifysignature(manifest, publickey)
+    return manifest
+
+
+def _checkdownload(manifest: dict, digest: str, size: int) -> None:
+    """
+    Utility function to check a downloaded file against the sha256 and size published in a manifest
+
+    :raises IntegrityError: If the file does not match
+    """
+    if manifest.get("size") is not None and size != manifest["size"]:
+        raise IntegrityError(f"Downloaded {size} bytes, but the manifest says {manifest['size']}")
+    if manifest.get("sha256") is not None and digest != manifest["sha256"].lower():
+        raise IntegrityError(f"Download's sha256 {digest} does not match the manifest's {manifest['sha256']}")
+
+
+def _splitlines(data: bytes) -> list:
+    """
+    Utility function to split bytes into lines, keeping the line endings
+    Unlike bytes.splitlines, only splits on \\n, like diff does
+    """
+    lines = [line + b"\n" for line in data.split(b"\n")]
+    lines[-1] = lines[-1][:-1]
+    return lines if lines[-1] else lines[:-1]
+
+
+def _applyunifieddiff(original: bytes, patch: bytes) -> bytes:
+    """
+    Utility function to apply a unified diff (as made by diff -u or difflib.unified_diff) to a file's contents
+    Every context and removed line must match the original exactly
+
+    :param original: Contents of the file to patch
+    :param patch: Unified diff of the file
+    :return: Contents of the patched file
+    :raises ValueError: If the diff is malformed or does not apply to original
+    """
+    import re
+    source = _splitlines(original)
+    result = []
+    position = 0
+    hunk = None
+    for line in _splitlines(patch):
+        if line.startswith(b"@@"):
+            if hunk:
+                position = _applyhunkline(source, result, position, *hunk.pop())
+            match = re.match(rb"@@ -(\d+)(?:,(\d+))? \+\d+(?:,\d+)? @@", line)
+            if match is None:
+                raise ValueError(f"Malformed hunk header: {line!r}")
+            start, count = int(match.group(1)), int(match.group(2) if match.group(2) is not None else 1)
+            # An empty hunk's start is the line after which the new lines are inserted
+            start = start if count == 0 else start - 1
+            if start < position or start > len(source):
+                raise ValueError(f"Hunk out of order or out of range: {line!r}")
+            result.extend(source[position:start])
+            position = start
+            hunk = []
+            continue
+        if hunk is None:
+            # Header lines before the first hunk
+            continue
+        if line.startswith(b"\\"):
+            # "\ No newline at end of file" applies to the previous line
+            if hunk:
+                tag, text = hunk[-1]
+                hunk[-1] = (tag, text[:-1] if text.endswith(b"\n") else text)
+                position = _applyhunkline(source, result, position, *hunk.pop(), fixed=True)
+            continue
+        tag, text = line[:1], line[1:]
+        if tag not in (b" ", b"-", b"+"):
+            if line.strip():
+                raise ValueError(f"Malformed diff line: {line!r}")
+            tag, text = b" ", b"\n"
+        if hunk:
+            position = _applyhunkline(source, result, position, *hunk.pop())
+        hunk.append((tag, text))
+    if hunk:
+        position = _applyhunkline(source, result, position, *hunk.pop())
+    result.extend(source[position:])
+    return b"".join(result)
+
+
+def _applyhunkline(source: list, result: list, position: int, tag: bytes, text: bytes, fixed: bool=False) -> int:
+    """
+    Utility function to apply a single line of a unified diff hunk
+
+    :param fixed: Whether text has already had its trailing newline stripped by a "No newline" marker
+    :return: Position in source after the line is applied
+    """
+    if tag == b"+":
+        result.append(text)
+        return position
+    if position >= len(source) or source[position] != text:
+        raise ValueError(f"Diff does not apply at line {position + 1}")
+    if tag == b" ":
+        result.append(text)
+    return position + 1
+
+
+def _applydelta(original: bytes, patch: bytes, deltaformat: str) -> bytes:
+    """
+    Utility function to apply a delta to a file's contents
+
+    :param original: Contents of the file to patch
+    :param patch: The delta
+    :param deltaformat: "unified" for a unified diff, or "bsdiff" for a bsdiff4 binary patch
+    (requires the bsdiff4 package)
+    :raises ValueError: If the delta cannot be applied
+    """
+    if deltaformat == "unified":
+        return _applyunifieddiff(original, patch)
+    if deltaformat == "bsdiff":
+        try:
+            import bsdiff4
+        except ImportError:
+            raise ValueError("The bsdiff4 package is required to apply bsdiff deltas") from None
+        return bsdiff4.patch(original, patch)
+    raise ValueError(f"Unknown delta format {deltaformat}")
+
+
+def _compileto(sourcepath: str, targetpath: str) -> None:
+    """
+    Utility function to compile a python file that is about to be installed at targetpath to bytecode
+    The bytecode is written to the __pycache__ entry of targetpath, so it is valid once sourcepath has been
+    renamed to targetpath (renaming keeps the modification time the bytecode is checked against)
+
+    :raises py_compile.PyCompileError: If the file does not compile
+    """
+    import py_compile
+    from importlib.util import cache_from_source
+    py_compile.compile(sourcepath, cfile=cache_from_source(targetpath), dfile=targetpath, doraise=True)
+
+
+class ResponseCache:
+    def __init__(self, cachedir: str=None, maxage: float=7 * 24 * 60 * 60):
+        """
+        Initializes responsecache class.
+        Stores http responses on disk, keyed by url, along with their ETag and Last-Modified headers,
+        so unchanged files can be revalidated with a conditional get request (which costs a 304 response
+        with no body) instead of being downloaded again.
+
+        :param cachedir: Directory to store cached responses in. Defaults to a PythonAutoUpdate folder in the
+        user's cache directory
+        :param maxage: Number of seconds an entry may go without being revalidated before it is evicted
+        """
+        self.cachedir = cachedir if cachedir else _defaultcachedir()
+        self.maxage = maxage
+
+    def _paths(self, link: str) -> (str, str):
+        """
+        Utility function to get the paths of the metadata and body files for a url
+        """
+        import hashlib
+        key = hashlib.sha256(link.encode("utf-8")).hexdigest()
+        return os.path.join(self.cachedir, key + ".json"), os.path.join(self.cachedir, key + ".body")
+
+    def _readmetadata(self, metadatapath: str) -> dict:
+        """
+        Utility function to read an entry's metadata file
+        If the file is missing or unreadable, returns None
+        """
+        try:
+            with open(metadatapath, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _remove(self, metadatapath: str, bodypath: str) -> None:
+        """
+        Utility function to delete an entry's files
+        """
+        for path in (metadatapath, bodypath):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _isstale(self, metadata: dict) -> bool:
+        return time.time() - metadata.get("validated", 0) > self.maxage
+
+    def lookup(self, link: str) -> dict:
+        """
+        Gets the cached entry for a url without reading its body
+        If there is no entry, or it is stale (in which case it is evicted), returns None
+
+        :param link: Url of the entry
+        :return: Entry metadata, with the path of the file holding the cached body under "bodypath"
+        """
+        metadatapath, bodypath = self._paths(link)
+        metadata = self._readmetadata(metadatapath)
+        if metadata is None or metadata.get("url") != link:
+            return None
+        if self._isstale(metadata):
+            self._remove(metadatapath, bodypath)
+            return None
+        if not os.path.isfile(bodypath):
+            return None
+        metadata["bodypath"] = bodypath
+        return metadata
+
+    def get(self, link: str) -> dict:
+        """
+        Gets the cached entry for a url
+        If there is no entry, or it is stale (in which case it is evicted), returns None
+
+        :param link: Url of the entry
+        :return: Entry metadata, with the cached body under "body"
+        """
+        metadata = self.lookup(link)
+        if metadata is None:
+            return None
+        try:
+            with open(metadata["bodypath"], 'rb') as f:
+                metadata["body"] = f.read()
+        except OSError:
+            return None
+        return metadata
+
+    def conditionalheaders(self, link: str) -> dict:
+        """
+        Gets the If-None-Match and If-Modified-Since headers to revalidate the cached entry for a url with
+        If there is no usable entry, returns an empty dict
+
+        :param link: Url of the entry
+        """
+        metadata = self._readmetadata(self._paths(link)[0])
+        headers = {}
+        if metadata is None or metadata.get("url") != link or self._isstale(metadata):
+            return headers
+        if metadata.get("etag"):
+            headers["If-None-Match"] = metadata["etag"]
+        if metadata.get("lastmodified"):
+            headers["If-Modified-Since"] = metadata["lastmodified"]
+        return headers
+
+    def store(self, link: str, body: bytes, etag: str=None, lastmodified: str=None, encoding: str=None) -> None:
+        """
+        Stores a response in the cache
+        Responses with neither an ETag nor a Last-Modified header cannot be revalidated, so they are not stored
+
+        :param link: Url the response was received from
+        :param body: Raw response body
+        :param etag: Value of the response's ETag header
+        :param lastmodified: Value of the response's Last-Modified header
+        :param encoding: Text encoding of the response body
+        """
+        if not (etag or lastmodified):
+            return
+        os.makedirs(self.cachedir, exist_ok=True)
+        metadatapath, bodypath = self._paths(link)
+        _atomicwrite(bodypath, body)
+        self._storemetadata(link, len(body), etag, lastmodified, encoding)
+
+    def storefile(self, link: str, path: str, etag: str=None, lastmodified: str=None, encoding: str=None) -> None:
+        """
+        Stores a response whose body was streamed to a file in the cache
+        Responses with neither an ETag nor a Last-Modified header cannot be revalidated, so they are not stored
+
+        :param link: Url the response was received from
+        :param path: Path of the file holding the response body
+        :param etag: Value of the response's ETag header
+        :param lastmodified: Value of the response's Last-Modified header
+        :param encoding: Text encoding of the response body
+        """
+        import shutil
+        if not (etag or lastmodified):
+            return
+        os.makedirs(self.cachedir, exist_ok=True)
+        metadatapath, bodypath = self._paths(link)
+        with open(path, 'rb') as source, _atomicreplace(bodypath) as f:
+            shutil.copyfileobj(source, f)
+        self._storemetadata(link, os.path.getsize(path), etag, lastmodified, encoding)
+
+    def _storemetadata(self, link: str, size: int, etag: str, lastmodified: str, encoding: str) -> None:
+        """
+        Utility function to write an entry's metadata file once its body has been stored
+        """
+        metadata = {"url": link, "etag": etag, "lastmodified": lastmodified, "encoding": encoding,
+                    "size": size, "validated": time.time()}
+        _atomicwrite(self._paths(link)[0], json.dumps(metadata).encode("utf-8"))
+        self._evictperiodically()
+
+    # Minimum number of seconds between sweeps of the whole cache for stale entries when storing responses
+    _EVICTINTERVAL = 24 * 60 * 60
+
+    def _evictperiodically(self) -> None:
+        """
+        Utility function to evict stale entries if the cache was last swept more than _EVICTINTERVAL seconds ago
+        The time of the last sweep is the modification time of a marker file, so every process sharing the
+        cache shares it. Stale entries are also evicted by lookup() whenever they are used
+        """
+        markerpath = os.path.join(self.cachedir, ".lastevicted")
+        try:
+            if 0 <= time.time() - os.path.getmtime(markerpath) < self._EVICTINTERVAL:
+                return
+        except OSError:
+            pass
+        try:
+            with open(markerpath, 'w'):
+                pass
+        except OSError:
+            return
+        self.evict()
+
+    def touch(self, link: str) -> None:
+        """
+        Marks the cached entry for a url as freshly revalidated (after the server returned 304 Not Modified)
+
+        :param link: Url of the entry
+        """
+        metadatapath = self._paths(link)[0]
+        metadata = self._readmetadata(metadatapath)
+        if metadata is not None:
+            metadata["validated"] = time.time()
+            _atomicwrite(metadatapath, json.dumps(metadata).encode("utf-8"))
+
+    def entries(self) -> list:
+        """
+        Lists the entries currently in the cache (without their bodies)
+        """
+        entries = []
+        try:
+            names = os.listdir(self.cachedir)
+        except OSError:
+            return entries
+        for name in sorted(names):
+            if name.endswith(".json"):
+                metadata = self._readmetadata(os.path.join(self.cachedir, name))
+                if metadata is not None:
+                    entries.append(metadata)
+        return entries
+
+    def evict(self) -> int:
+        """
+        Deletes all stale entries from the cache
+
+        :return: Number of entries deleted
+        """
+        evicted = 0
+        for metadata in self.entries():
+            if self._isstale(metadata):
+                self._remove(*self._paths(metadata["url"]))
+                evicted += 1
+        return evicted
+
+    def clear(self) -> None:
+        """
+        Deletes all entries from the cache
+        """
+        for metadata in self.entries():
+            self._remove(*self._paths(metadata["url"]))
+
+
+class StateStore:
+    def __init__(self, path: str):
+        """
+        Initializes statestore class.
+        Persists a small dict of values to a json file. Writes are atomic, so concurrent processes
+        always read either the old or the new state, and updates hold a lock on path + ".lock", so concurrent
+        processes never lose each other's values.
+
+        :param path: Path of the json file to store the state in
+        """
+        self.path = path
+
+    def load(self) -> dict:
+        """
+        Reads the stored state
+        If the file is missing or unreadable, returns an empty dict
+        """
+        try:
+            with open(self.path, 'r') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return state if isinstance(state, dict) else {}
+
+    def get(self, key: str, default=None):
+        """
+        Reads a single value from the stored state
+
+        :param key: Key of the value
+        :param default: Value to return if key is not stored
+        """
+        return self.load().get(key, default)
+
+    def update(self, **values) -> None:
+        """
+        Merges values into the stored state
+
+        :param values: Values to store
+        """
+        lock = FileLock(self.path + ".lock")
+        lock.acquire(pollinterval=0.005)
+        try:
+            state = self.load()
+            state.update(values)
+            _atomicwrite(self.path, json.dumps(state).encode("utf-8"))
+        finally:
+            lock.release()
+
+
+class FileLock:
+    def __init__(self, path: str):
+        """
+        Initializes filelock class.
+        An exclusive lock shared by every process on the host that uses the same lock file
+        (flock on posix, msvcrt.locking on windows). The lock is released automatically if its process dies.
+
+        :param path: Path of the lock file. It is created if it does not exist
+        """
+        self.path = path
+        self._fd = None
+
+    def _trylock(self, fd: int) -> bool:
+        """
+        Utility function to try to lock a file descriptor without blocking
+        """
+        try:
+            if os.name == "nt":
+                import msvcrt
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return False
+        return True
+
+    def acquire(self, timeout: float=None, pollinterval: float=0.05) -> bool:
+        """
+        Acquires the lock, waiting for other processes to release it if necessary
+
+        :param timeout: Maximum number of seconds to wait. If timeout is None, waits forever.
+        If timeout is 0, only tries once
+        :param pollinterval: Number of seconds to wait between attempts
+        :return: Whether the lock was acquired
+        """
+        if self._fd is not None:
+            raise RuntimeError(f"{self.path} is already locked by this FileLock")
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._trylock(fd):
+            if deadline is not None and time.monotonic() >= deadline:
+                os.close(fd)
+                return False
+            time.sleep(pollinterval)
+        self._fd = fd
+        return True
+
+    def release(self) -> None:
+        """
+        Releases the lock
+        """
+        if self._fd is None:
+            return
+        try:
+            if os.name == "nt":
+                import msvcrt
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class UpdateInfo(namedtuple("UpdateInfo", ["cloudversion", "whatsnew", "updateavailable"])):
+    """
+    Result of an update check
+
+    :param cloudversion: The latest version on remote github repository
+    :param whatsnew: The changelog of the latest version (None if it could not be retrieved)
+    :param updateavailable: Whether the latest version is newer than the current version and is not ignored
+    """
+    __slots__ = ()
+
+
+class UpdateEvent(namedtuple("UpdateEvent", ["name", "duration", "fields"])):
+    """
+    A timed step of an update check or update, passed to the handler's observers
+
+    :param name: What happened:
+    -request: An http request (fields: link, status, ttfb, transfer, bytes, attempt (the number of times it
+    had been retried), and error if it failed).
+    ttfb is the number of seconds until the response headers arrived, which includes resolving the host,
+    connecting and the TLS handshake when a new connection is opened (they are not reported separately).
+    transfer is the number of seconds spent reading the body. status is None if no response was received
+    -cachehit: A 304 Not Modified response answered from the cache (fields: link, bytes)
+    -lockwait: Waiting for the update lock (fields: acquired)
+    -fsync: Flushing an installed file to disk (fields: path)
+    -install: Installing a downloaded script or project (fields: method ("delta", "full" or "files"), bytes)
+    -check: An update check (fields: outcome ("updateavailable", "uptodate" or "failed"), throttled,
+    cloudversion)
+    -update: An update() or updatefiles() call (fields: outcome ("installed", "alreadyinstalled" or "failed"),
+    version, and error if it failed)
+    :param duration: Number of seconds the step took
+    :param fields: Dict of details about the step
+    """
+    __slots__ = ()
+
+
+class MetricsAggregator:
+    # Upper bounds (in seconds) of the histogram buckets
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float("inf"))
+    # Fields counted by value, fields timed in their own histogram, and fields summed into a counter
+    _LABELFIELDS = ("status", "outcome", "method", "acquired")
+    _TIMINGFIELDS = ("ttfb", "transfer")
+    _SIZEFIELDS = ("bytes",)
+
+    def __init__(self, buckets: tuple=None):
+        """
+        Initializes metricsaggregator class.
+        Observer that aggregates UpdateEvents into counters and histograms, to export to a metrics system.
+        Pass it in an UpdateHandler's observers. It can be shared by several handlers and threads.
+
+        Counters are named after the event (request), the event and the value of a field (request.status.304),
+        or the event and a size field (request.bytes). Histograms are named after the event (for its duration)
+        or the event and a timing field (request.ttfb).
+
+        :param buckets: Upper bounds (in seconds) of the histogram buckets. Defaults to BUCKETS
+        """
+        import threading
+        self.buckets = tuple(buckets) if buckets else self.BUCKETS
+        if self.buckets[-1] != float("inf"):
+            self.buckets += (float("inf"),)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Clears every counter and histogram
+        """
+        with self._lock:
+            self.counters = {}
+            self.histograms = {}
+
+    def __call__(self, event: UpdateEvent) -> None:
+        with self._lock:
+            self._count(event.name, 1)
+            self._observe(event.name, event.duration)
+            for field, value in event.fields.items():
+                if field in self._LABELFIELDS:
+                    self._count(f"{event.name}.{field}.{value}", 1)
+                elif field in self._TIMINGFIELDS and value is not None:
+                    self._observe(f"{event.name}.{field}", value)
+                elif field in self._SIZEFIELDS and value is not None:
+                    self._count(f"{event.name}.{field}", value)
+
+    def _count(self, name: str, amount: int) -> None:
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def _observe(self, name: str, value: float) -> None:
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = {"count": 0, "sum": 0.0, "min": value, "max": value,
+                                                 "buckets": [0] * len(self.buckets)}
+        histogram["count"] += 1
+        histogram["sum"] += value
+        histogram["min"] = min(histogram["min"], value)
+        histogram["max"] = max(histogram["max"], value)
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                histogram["buckets"][index] += 1
+                break
+
+    def dump(self) -> dict:
+        """
+        Gets a json serializable snapshot of the counters and histograms:
+        {"counters": {name: value}, "histograms": {name: {"count", "sum", "min", "max", "buckets"}}}
+        where buckets maps the upper bound of each bucket ("+Inf" for the last) to the cumulative number of
+        values up to that bound, like Prometheus histograms
+        """
+        with self._lock:
+            histograms = {}
+            for name, histogram in self.histograms.items():
+                cumulative = 0
+                buckets = {}
+                for bound, count in zip(self.buckets, histogram["buckets"]):
+                    cumulative += count
+                    buckets["+Inf" if bound == float("inf") else str(bound)] = cumulative
+                histograms[name] = {"count": histogram["count"], "sum": histogram["sum"],
+                                    "min": histogram["min"], "max": histogram["max"], "buckets": buckets}
+            return {"counters": dict(self.counters), "histograms": histograms}
 
 
 class UpdateHandler:
     def __init__(self, repolink: str,
-                 scriptname: str=None, versionlink: str=None, whatsnewlink: str=None, scriptlink: str=None):
+                 scriptname: str=None, versionlink: str=None, whatsnewlink: str=None, scriptlink: str=None,
+                 session: "requests.Session"=None, poolsize: int=4, cache: ResponseCache=None,
+                 checkinterval: float=0, statefile: str=None, timeout: float=(5, 10), scriptpath: str=None,
+                 manifestlink: str=None, publickey: str=None, settingsfile: str=None, locktimeout: float=60,
+                 rootdir: str=None, objectsdir: str=None, currentversion: str=None, precompile: bool=False,
+                 observers: list=None, retries: int=2, backoff: float=0.5, maxbackoff: float=8,
+                 budget: float=30, mirrors: list=None):
+        """
+        Initializes updatehandler class.
+
+        :param repolink: Root link to the github repository
+        :param scriptname: The name of the current script
+        :param versionlink: Link to the version.txt file in the github repository
+        :param whatsnewlink: Link to the whatsnew.txt file in the github repository
+        :param scriptlink: Link to the script file in the github repository
+        :param session: requests.Session to make http requests with. Pass the same session to several
+        handlers to share one connection pool between them. If not specified, one is created on first use
+        :param poolsize: Maximum number of pooled connections kept open per host
+        (ignored if session is specified)
+        :param cache: ResponseCache to revalidate the version, changelog and script with instead of downloading
+        them again. If cache is None, responses are not cached
+        :param checkinterval: Minimum number of seconds between update checks. Checks made within checkinterval
+        of the last one are decided from the persisted state without making any http requests
+        :param statefile: Path of the json file the last check is persisted to. Defaults to a file named after
+        scriptname and a hash of the link update checks are made to in the user's PythonAutoUpdate config directory
+        :param timeout: Number of seconds to wait for the server before giving up on a request, or a
+        (connect, read) tuple of the number of seconds to wait for the connection and for each read
+        :param scriptpath: Path of the local file that update() replaces. Defaults to this file
+        :param manifestlink: Link to a json (or toml) manifest publishing the latest version, its changelog, the
+        link(s) to the script and the sha256 and size of the script. If specified, update checks make a single
+        request for the manifest instead of requesting versionlink and whatsnewlink, and update() downloads the
+        script from the manifest's links and verifies it against the manifest before installing it
+        :param publickey: Base64 encoded Ed25519 public key the manifest must be signed with
+        (requires the cryptography package). If publickey is None, the signature is not checked
+        :param settingsfile: Path of the json file the user's preferences (the ignored version and whether update
+        checking is enabled) are stored in. Defaults to a file named after scriptname and a hash of the absolute
+        scriptpath in the user's PythonAutoUpdate config directory. _IGNOREVERSION and _UPDATECHECKING are used until a preference is stored
+        :param locktimeout: Maximum number of seconds update() waits for another process that is updating the
+        same script to finish
+        :param rootdir: Root directory of the project updated by updatefiles(). Defaults to the directory of
+        scriptpath
+        :param objectsdir: Directory updatefiles() stages downloaded files in, named by their sha256.
+        Defaults to an objects folder in the user's PythonAutoUpdate cache directory. Processes that download
+        the same file into it wait for each other (for up to locktimeout seconds)
+        :param currentversion: The current version of the script. Defaults to __version__
+        :param precompile: Whether to compile updated python files to bytecode before installing them, so the
+        first run after an update does not have to, and files that do not compile are never installed
+        :param observers: Functions to call with an UpdateEvent for every timed step of update checks and updates
+        (requests, cache hits, lock waits, installs and their outcome), for example a MetricsAggregator.
+        Exceptions raised by observers are ignored
+        :param retries: Maximum number of times to retry a request that fails to connect, times out, or gets a 429
+        or 5xx response
+        :param backoff: Number of seconds to wait before the first retry. Each retry waits up to twice as long as
+        the last (a random amount, so many clients do not retry in step), unless the server asks for a wait with
+        Retry-After
+        :param maxbackoff: Maximum number of seconds to wait between retries
+        :param budget: Maximum number of seconds an update check may spend on requests, including retries and
+        failing over to mirrors. If budget is None, checks are only bounded by timeout and retries
+        :param mirrors: Base links to fetch the repository's files from, in order of preference, like
+        ["https://raw.githubusercontent.com/user/repo/master", "https://cdn.jsdelivr.net/gh/user/repo@master"].
+        Any link under one of them (including links from the manifest) is fetched from the next mirror if it fails.
+        The fastest healthy mirror is remembered in statefile and tried first next time.
+        Defaults to the repository's raw.githubusercontent.com master branch
+
+        If not specified, scriptname, versionlink, whatsnewlink, and scriptlink will be automatically generated
+        If importing as a module, make sure you specify scriptname - if you don't, it will default to the name
+        of this module
+        """
+        self.repolink = repolink
+        rawrepolink = repolink.replace("https://github.com","https://raw.githubusercontent.com")
+        self.mirrors = [mirror.rstrip("/") for mirror in mirrors] if mirrors else [rawrepolink + "/master"]
+        if not scriptname:
+            scriptname = os.path.basename(__file__)
+        if not versionlink:
+            versionlink = self.mirrors[0] + "/version.txt"
+        if not whatsnewlink:
+            whatsnewlink = self.mirrors[0] + "/whatsnew.txt"
+        if not scriptlink:
+            scriptlink = self.mirrors[0] + f"/{scriptname}"
+        self.scriptname = scriptname
+        self.versionlink = versionlink
+        self.whatsnewlink = whatsnewlink
+        self.scriptlink = scriptlink
+        import threading
+        self.poolsize = poolsize
+        self._session = session
+        # Held while the session is created, so threads making their first requests at once share one session
+        self._sessionlock = threading.Lock()
+        self.cache = cache
+        self.checkinterval = checkinterval
+        self.timeout = timeout
+        self.scriptpath = scriptpath if scriptpath else __file__
+        self.manifestlink = manifestlink
+        if not statefile:
+            statefile = _defaultfile(scriptname, manifestlink or versionlink, "state.json")
+        self.state = StateStore(statefile)
+        if not settingsfile:
+            settingsfile = _defaultfile(scriptname, os.path.abspath(self.scriptpath), "settings.json")
+        self.settings = StateStore(settingsfile)
+        self.publickey = publickey
+        self.locktimeout = locktimeout
+        self.lockpath = self.scriptpath + ".lock"
+        self.rootdir = rootdir if rootdir else os.path.dirname(os.path.abspath(self.scriptpath))
+        self.objectsdir = objectsdir if objectsdir else os.path.join(_defaultcachedir(), "objects")
+        self.currentversion = currentversion if currentversion else __version__
+        self.precompile = precompile
+        self.observers = list(observers) if observers else []
+        self.retries = retries
+        self.backoff = backoff
+        self.maxbackoff = maxbackoff
+        self.budget = budget
+        # Latency and last failure of each mirror, loaded from the state file on first use
+        self._mirrorhealth = None
+        # Manifest fetched by the last update check, reused by update() so it is not requested twice
+        self._manifest = None
+
+    @staticmethod
+    def makesession(poolsize: int=4) -> "requests.Session":
+        """
+        Creates a requests.Session with a reusable connection pool.
+        Connections are kept alive between requests, so only the first request to a host pays for the
+        TCP and TLS handshakes.
+        If requests is not installed, returns a session that makes requests with urllib instead
+
+        :param poolsize: Maximum number of pooled connections kept open per host
+        """
+        if _loadrequests() is None:
+            return _UrllibSession()
+        from requests.adapters import HTTPAdapter
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=poolsize, pool_maxsize=poolsize)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    @property
+    def session(self) -> "requests.Session":
+        """
+        The http session, which is created (importing the http stack) on first use
+        """
+        if self._session is None:
+            with self._sessionlock:
+                if self._session is None:
+                    self._session = self.makesession(self.poolsize)
+        return self._session
+
+    @session.setter
+    def session(self, session: "requests.Session") -> None:
+        self._session = session
+
+    def close(self) -> None:
+        """
+        Closes the http session and all of its pooled connections.
+        """
+        if self._session is not None:
+            self._session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _emit(self, name: str, duration: float, **fields) -> None:
+        """
+        Utility function to pass an UpdateEvent to the observers
+        """
+        if not self.observers:
+            return
+        event = UpdateEvent(name, duration, fields)
+        for observer in self.observers:
+            try:
+                observer(event)
+            except Exception:
+                pass
+
+    def _reportrequest(self, link: str, status: int, start: float, ttfb: float, size: int,
+                       error: str=None, attempt: int=0) -> None:
+        """
+        Utility function to report a finished http request to the observers
+
+        :param start: time.perf_counter() when the request was made
+        :param ttfb: Number of seconds until the response headers arrived (None if there was no response)
+        :param size: Number of bytes of the response body that were read
+        :param error: Why the request failed, if it did
+        :param attempt: Number of times the request had already been retried
+        """
+        now = time.perf_counter()
+        fields = {"link": link, "status": status, "ttfb": ttfb,
+                  "transfer": now - start - ttfb if ttfb is not None else None, "bytes": size, "attempt": attempt}
+        if error is not None:
+            fields["error"] = error
+        self._emit("request", now - start, **fields)
+
+    # Statuses that mean the server is overloaded or rate limiting, so the request is worth retrying
+    _RETRYSTATUSES = (429, 500, 502, 503, 504)
+
+    def _deadline(self) -> float:
+        """
+        Utility function to get the time.monotonic() by which a check started now must be done
+        If budget is None, returns None
+        """
+        return time.monotonic() + self.budget if self.budget is not None else None
+
+    def _timeoutwithin(self, deadline: float):
+        """
+        Utility function to get the timeout for a request that must be done by deadline
+        If deadline has passed, returns None
+
+        :param deadline: time.monotonic() by which the request must be done (None for no deadline)
+        :return: timeout, capped so that neither the connect nor the read timeout reaches past deadline
+        """
+        if deadline is None:
+            return self.timeout
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        if isinstance(self.timeout, tuple):
+            return tuple(min(part, remaining) if part is not None else remaining for part in self.timeout)
+        return min(self.timeout, remaining) if self.timeout is not None else remaining
+
+    def _retrydelay(self, attempt: int, retryafter: str=None, deadline: float=None) -> float:
+        """
+        Utility function to get how long to wait before retrying a failed request
+        Waits are exponential with full jitter, unless the server asked for a wait with Retry-After
+        If the request should not be retried (it was retried retries times already, the server asked for a wait
+        longer than maxbackoff, or waiting would reach past deadline), returns None
+
+        :param attempt: Number of times the request has already been retried
+        :param retryafter: The response's Retry-After header, if there was a response
+        :param deadline: time.monotonic() by which the request must be done (None for no deadline)
+        """
+        import random
+        if attempt >= self.retries:
+            return None
+        delay = _parseretryafter(retryafter)
+        if delay is None:
+            delay = random.uniform(0, min(self.maxbackoff, self.backoff * 2 ** attempt))
+        elif not delay <= self.maxbackoff:
+            # Rather than holding up the program for as long as a rate limited server asks
+            return None
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            return None
+        return delay
+
+    def _retryfailure(self, link: str, attempt: int, start: float, status: int, ttfb: float, err: Exception,
+                      timeout, deadline: float=None) -> float:
+        """
+        Utility function to report a request that raised, and get how long to wait before retrying it
+        If it should not be retried, returns None
+
+        :param timeout: Timeout the request was made with (None if it ran out of time before it was made)
+        """
+        self._reportrequest(link, status, start, ttfb, 0, error=str(err), attempt=attempt)
+        return self._retrydelay(attempt, deadline=deadline) if timeout is not None else None
+
+    def _retryresponse(self, link: str, attempt: int, start: float, status: int, ttfb: float, size: int,
+                       retryafter: str, stream: bool, deadline: float=None) -> float:
+        """
+        Utility function to get how long to wait before retrying a request that got a response
+        The request is reported, unless its response is handed to a caller that streams the body (which reports it)
+        If it should not be retried, returns None
+
+        :param size: Number of bytes of the response body that were read (None if it was not read)
+        """
+        delay = None
+        if status in self._RETRYSTATUSES:
+            delay = self._retrydelay(attempt, retryafter, deadline)
+        if delay is not None or not stream:
+            self._reportrequest(link, status, start, ttfb, size, attempt=attempt)
+        return delay
+
+    def _requestfailure(self, message: str) -> Exception:
+        """
+        Utility function to make the exception raised when an http request fails
+        """
+        return _requesterror(message)
+
+    def _timedget(self, link: str, headers: dict=None, stream: bool=False,
+                  deadline: float=None) -> ("requests.Response", float, float):
+        """
+        Utility function to make http get request, retrying it if it fails, and time it for the observers
+        Requests that fail to connect, time out, or get a 429 or 5xx response are retried (see _retrydelay).
+        If they still fail, the last error is raised, or the last response is returned
+        Unless stream is True, the body is read and the request is reported before returning. If stream is True,
+        the caller reads the body and reports the request with _reportrequest
+
+        :param deadline: time.monotonic() by which the request and its retries must be done (None for no deadline)
+        :return: The response, time.perf_counter() when the request was made, and the number of seconds until
+        the response headers arrived
+        :raises requests.exceptions.RequestException (an OSError): If the request fails
+        """
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            status = ttfb = size = None
+            timeout = self._timeoutwithin(deadline)
+            try:
+                if timeout is None:
+                    raise self._requestfailure(f"Request to {link} ran out of time")
+                response = self.session.get(link, headers=headers, stream=True, timeout=timeout)
+                status, ttfb = response.status_code, time.perf_counter() - start
+                if not stream or status in self._RETRYSTATUSES:
+                    size = len(response.content)
+            except OSError as err:
+                delay = self._retryfailure(link, attempt, start, status, ttfb, err, timeout, deadline)
+                if delay is None:
+                    raise
+            else:
+                delay = self._retryresponse(link, attempt, start, status, ttfb, size,
+                                            response.headers.get("Retry-After"), stream, deadline)
+                if delay is None:
+                    return response, start, ttfb
+                response.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def _mirrorlinks(self, link: str) -> list:
+        """
+        Utility function to get the links to fetch a file from, in the order they should be tried
+        If link is under one of the mirrors, it is rewritten under each mirror, the healthiest and fastest first.
+        Otherwise it is returned as is
+        """
+        for mirror in self.mirrors:
+            if link.startswith(mirror + "/"):
+                path = link[len(mirror):]
+                return [other + path for other in self._orderedmirrors()]
+        return [link]
+
+    # Number of seconds a mirror that failed is tried after the mirrors that did not
+    _MIRRORCOOLDOWN = 10 * 60
+
+    def _orderedmirrors(self) -> list:
+        """
+        Utility function to get the mirrors in the order they should be tried:
+        the ones that have not failed recently before the ones that have, each sorted by their latency
+        (mirrors that have never been measured go after the measured ones, in the order they were given)
+        """
+        if len(self.mirrors) == 1:
+            return self.mirrors
+        health = self._loadmirrorhealth()
+        now = time.time()
+
+        def preference(indexedmirror):
+            index, mirror = indexedmirror
+            entry = health.get(mirror, {})
+            failed = now - entry.get("failedat", float("-inf")) < self._MIRRORCOOLDOWN
+            latency = entry.get("latency")
+            return failed, latency is None, latency or 0, index
+
+        return [mirror for _, mirror in sorted(enumerate(self.mirrors), key=preference)]
+
+    def _loadmirrorhealth(self) -> dict:
+        """
+        Utility function to get the latency and last failure of each mirror, loading them from the state file
+        """
+        if self._mirrorhealth is None:
+            health = self.state.get("mirrors")
+            self._mirrorhealth = health if isinstance(health, dict) else {}
+        return self._mirrorhealth
+
+    def _recordmirror(self, link: str, latency: float=None, failed: bool=False) -> None:
+        """
+        Utility function to record how a request to a mirror went, so the next request prefers healthy, fast
+        mirrors. Call _savemirrors to persist the records
+
+        :param link: Link that was requested
+        :param latency: Number of seconds until the response headers arrived, if the request succeeded
+        :param failed: Whether the request failed
+        """
+        if len(self.mirrors) == 1:
+            return
+        for mirror in self.mirrors:
+            if link.startswith(mirror + "/"):
+                break
+        else:
+            return
+        entry = dict(self._loadmirrorhealth().get(mirror, {}))
+        if failed:
+            entry["failedat"] = time.time()
+        else:
+            entry.pop("failedat", None)
+            if latency is not None:
+                # Smooth the latency so one slow response does not reorder the mirrors
+                entry["latency"] = latency if entry.get("latency") is None else (entry["latency"] + latency) / 2
+        self._mirrorhealth[mirror] = entry
+
+    def _savemirrors(self) -> None:
+        """
+        Utility function to persist the health of the mirrors recorded by _recordmirror
+        """
+        if self._mirrorhealth is None or len(self.mirrors) == 1:
+            return
+        try:
+            self.state.update(mirrors=self._mirrorhealth)
+        except OSError:
+            pass
+
+    def _getrequest(self, link: str, errormessage: str = None, deadline: float=None) -> (int, str):
+        """
+        Utility function to make http get request, failing over to the mirrors if it fails
+        If request fails, returns (None, None)
+
+        :param link: Link to make request to
+        :param errormessage: Error message to print if request fails. If errormessage is None,
+        no error messages will be printed
+        :param deadline: time.monotonic() by which the request must be done. Defaults to budget seconds from now
+        """
+        if deadline is None:
+            deadline = self._deadline()
+        for mirrorlink in self._mirrorlinks(link):
+            start = time.perf_counter()
+            status, text = self._getfrom(mirrorlink, deadline)
+            if self._recordmirrorstatus(mirrorlink, status, start):
+                return True, text
+        return self._requestfailed(link, status, text, errormessage)
+
+    def _recordmirrorstatus(self, link: str, status: int, start: float) -> bool:
+        """
+        Utility function to record how a request to a mirror went from its status (see _recordmirror)
+        Only connection errors, 429 and 5xx statuses count against the mirror
+
+        :param start: time.perf_counter() when the request was made
+        :return: Whether the request succeeded
+        """
+        if status == 200:
+            self._recordmirror(link, latency=time.perf_counter() - start)
+            return True
+        self._recordmirror(link, failed=status is None or status in self._RETRYSTATUSES)
+        return False
+
+    @staticmethod
+    def _requestfailed(link: str, status: int, text: str, errormessage: str=None) -> (bool, str):
+        """
+        Utility function to print why a request failed (if errormessage is not None) and get what _getrequest
+        returns for it: (None, None) if there was no response, or (False, text) if there was
+        """
+        if errormessage is not None:
+            if status is None:
+                print(f"{errormessage}: Get request to {link} failed")
+            else:
+                print(f"{errormessage}:"
+                      f" {link}"
+                      " returned http status code"
+                      f" {str(status)}")
+        return (None, None) if status is None else (False, text)
+
+    def _getfrom(self, link: str, deadline: float=None) -> (int, str):
+        """
+        Utility function to make http get request to a single link, revalidating it with the cache
+        If request fails, returns (None, None)
+
+        :return: The http status code (200 if the response was answered from the cache) and the response text
+        """
+        headers = self.cache.conditionalheaders(link) if self.cache is not None else {}
+        try:
+            response = self._timedget(link, headers=headers, deadline=deadline)[0]
+            if response.status_code == 304 and self.cache is not None:
+                text = self._revalidated(link)
+                if text is not None:
+                    return 200, text
+                # The entry vanished since the request was made; fetch it unconditionally
+                response = self._timedget(link, deadline=deadline)[0]
+        except Exception:
+            return None, None
+        self._storeresponse(link, response.status_code, response.content, response.headers, response.encoding)
+        return response.status_code, response.text
+
+    def _revalidated(self, link: str) -> str:
+        """
+        Utility function to get the text of the cached entry for a url the server answered 304 Not Modified for,
+        and mark it freshly revalidated
+        If the entry vanished since the request was made, returns None
+        """
+        start = time.perf_counter()
+        cached = self.cache.get(link)
+        if cached is None:
+            return None
+        self.cache.touch(link)
+        self._emit("cachehit", time.perf_counter() - start, link=link, bytes=len(cached["body"]))
+        return cached["body"].decode(cached["encoding"] or "utf-8", errors="replace")
+
+    def _storeresponse(self, link: str, status: int, body: bytes, headers, encoding: str) -> None:
+        """
+        Utility function to store a successful response in the cache, if there is one
+        """
+        if status == 200 and self.cache is not None:
+            try:
+                self.cache.store(link, body, etag=headers.get("ETag"), lastmodified=headers.get("Last-Modified"),
+                                 encoding=encoding)
+            except OSError:
+                pass
+
+    def ignoreversion(self, version: str) -> None:
+        """
+        Ignores specified version when checking for updates.
+        The preference is stored in the settings file, so the script itself is never edited.
+
+        :param version: Version to ignore
+        """
+        self.settings.update(ignoreversion=version)
+
+    def disableupdatechecking(self) -> None:
+        """
+        Disables update checking.
+        The preference is stored in the settings file, so the script itself is never edited.
+        """
+        self.settings.update(updatechecking=False)
+
+    def enableupdatechecking(self) -> None:
+        """
+        Re-enables update checking after it has been disabled with disableupdatechecking.
+        """
+        self.settings.update(updatechecking=True)
+
+    def updatecheckingenabled(self) -> bool:
+        """
+        Gets whether update checking is enabled
+        """
+        return self.settings.get("updatechecking", _UPDATECHECKING)
+
+    def _updateavailable(self, cloudversion: str) -> bool:
+        """
+        Utility function to get whether a version is an update the user has not ignored
+        """
+        return not (cloudversion == self.currentversion
+                    or cloudversion == self.settings.get("ignoreversion", _IGNOREVERSION))
+
+    # Suffix of the staging file a download is written to, and of the file its validator is kept in
+    _PARTSUFFIX = ".part"
+    _PARTINFOSUFFIX = ".part.json"
+
+    @classmethod
+    def _resumeheaders(cls, link: str, partpath: str) -> (dict, int):
+        """
+        Utility function to get the headers to resume an interrupted download of link into partpath with
+        The range is validated with If-Range, so the server sends the whole file instead if it has changed,
+        and the rest of the file is requested uncompressed, since the staging file holds decompressed bytes
+        If there is nothing to resume, returns (None, 0)
+
+        :return: The headers, and the number of bytes already downloaded
+        """
+        try:
+            with open(partpath[:-len(cls._PARTSUFFIX)] + cls._PARTINFOSUFFIX, 'r') as f:
+                info = json.load(f)
+            size = os.path.getsize(partpath)
+        except (OSError, ValueError):
+            return None, 0
+        if not isinstance(info, dict) or info.get("link") != link or not info.get("validator") or size == 0:
+            return None, 0
+        return {"Range": f"bytes={size}-", "If-Range": info["validator"], "Accept-Encoding": "identity"}, size
+
+    @classmethod
+    def _beginpart(cls, link: str, partpath: str, headers) -> None:
+        """
+        Utility function to record what a new download into partpath can be resumed with
+        A download can only be resumed if the server sent a strong ETag or a Last-Modified date
+
+        :param headers: The response's headers
+        """
+        infopath = partpath[:-len(cls._PARTSUFFIX)] + cls._PARTINFOSUFFIX
+        validator = headers.get("ETag")
+        if not validator or validator.startswith("W/"):
+            validator = headers.get("Last-Modified")
+        try:
+            if validator:
+                with open(infopath, 'w') as f:
+                    json.dump({"link": link, "validator": validator}, f)
+            elif os.path.exists(infopath):
+                os.remove(infopath)
+        except OSError:
+            pass
+
+    @classmethod
+    def _discardpart(cls, partpath: str, keepdata: bool=False) -> None:
+        """
+        Utility function to remove a staging file and its validator
+
+        :param keepdata: Whether to only remove the validator (once the download is complete)
+        """
+        paths = [partpath[:-len(cls._PARTSUFFIX)] + cls._PARTINFOSUFFIX]
+        if not keepdata:
+            paths.append(partpath)
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _rangestart(headers) -> int:
+        """
+        Utility function to get the offset a 206 Partial Content response starts at, from its Content-Range header
+        If the header is missing or malformed, returns None
+        """
+        contentrange = headers.get("Content-Range", "")
+        if not contentrange.startswith("bytes ") or "-" not in contentrange:
+            return None
+        try:
+            return int(contentrange[len("bytes "):].split("-", 1)[0])
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _hashfile(digest, path: str, chunksize: int=64 * 1024) -> None:
+        """
+        Utility function to feed a file to a hash object without reading it all into memory
+        """
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunksize), b""):
+                digest.update(chunk)
+
+    def _download(self, link: str, partpath: str, chunksize: int=64 * 1024, progress: dict=None) -> str:
+        """
+        Utility function to stream the response to an http get request into a staging file, hashing it on the fly
+        Memory use is bounded by chunksize, no matter how large the response is
+        Compressed responses are decompressed as they arrive. If the transfer is interrupted, what arrived is kept
+        in partpath, and the next call for the same link resumes the download where it stopped with a Range
+        request, if the server supports it and the file has not changed
+
+        :param link: Link to make request to
+        :param partpath: Path of the staging file to write the response body to
+        :param chunksize: Maximum number of bytes to read at a time
+        :param progress: Dict to set "started" in once the response body starts being written, so callers can
+        tell an interrupted transfer from a failed request
+        :return: The sha256 hex digest of the whole response body
+        :raises requests.exceptions.RequestException (an OSError): If the request fails
+        """
+        import hashlib
+        digest = hashlib.sha256()
+        headers, offset, cached = self._downloadheaders(link, partpath)
+        response, start, ttfb = self._timedget(link, headers=headers, stream=True)
+        size = 0
+        with response:
+            if response.status_code == 304 and cached is not None:
+                self._reportrequest(link, 304, start, ttfb, 0)
+                self._copycached(link, cached, partpath, digest, chunksize)
+                return digest.hexdigest()
+            mode = self._partmode(link, partpath, response.status_code, response.headers, offset, digest)
+            if mode is None:
+                self._reportrequest(link, response.status_code, start, ttfb, 0)
+                raise self._requestfailure(f"Request to {link} failed.")
+            if progress is not None:
+                progress["started"] = True
+            try:
+                with open(partpath, mode) as f:
+                    for chunk in self._iterbody(response, chunksize):
+                        digest.update(chunk)
+                        f.write(chunk)
+                        size += len(chunk)
+            except Exception as err:
+                self._reportrequest(link, response.status_code, start, ttfb, size, error=str(err))
+                raise
+            self._reportrequest(link, response.status_code, start, ttfb, size)
+            self._finishdownload(link, partpath, response.headers, response.encoding)
+        return digest.hexdigest()
+
+    @staticmethod
+    def _iterbody(response, chunksize: int):
+        """
+        Utility function to iterate over the body of a streamed response as it arrives, in chunks of at most
+        chunksize bytes
+        Unlike iter_content, a requests response yields whatever arrived before the connection dropped (instead
+        of discarding the partly filled chunk), so an interrupted download can be resumed from there
+
+        :raises requests.exceptions.RequestException (an OSError): If the connection drops
+        """
+        read1 = getattr(getattr(response, "raw", None), "read1", None)
+        if isinstance(response, _UrllibResponse) or read1 is None:
+            yield from response.iter_content(chunk_size=chunksize)
+            return
+        import urllib3
+        try:
+            for chunk in iter(lambda: read1(chunksize, decode_content=True), b""):
+                yield chunk
+        except urllib3.exceptions.HTTPError as err:
+            raise requests.exceptions.ChunkedEncodingError(err) from err
+
+    def _downloadheaders(self, link: str, partpath: str) -> (dict, int, dict):
+        """
+        Utility function to get the headers to download link into partpath with: the headers to resume an
+        interrupted download if there is one, or else the headers to revalidate the cached copy if there is one
+
+        :return: The headers, the number of bytes already downloaded (None if the download is not resumed),
+        and the cache entry that is revalidated (None if there is none)
+        """
+        headers, offset = self._resumeheaders(link, partpath)
+        if headers is not None:
+            return headers, offset, None
+        cached = self.cache.lookup(link) if self.cache is not None else None
+        return (self.cache.conditionalheaders(link) if cached is not None else {}), None, cached
+
+    def _copycached(self, link: str, cached: dict, partpath: str, digest, chunksize: int=64 * 1024) -> None:
+        """
+        Utility function to copy the cached body of a download the server answered 304 Not Modified for into
+        partpath, hashing it on the fly
+
+        :param cached: The cache entry returned by _downloadheaders
+        :param digest: Hash object to feed the body to
+        """
+        start = time.perf_counter()
+        self.cache.touch(link)
+        size = 0
+        with open(cached["bodypath"], 'rb') as source, open(partpath, 'wb') as f:
+            for chunk in iter(lambda: source.read(chunksize), b""):
+                digest.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+        self._discardpart(partpath, keepdata=True)
+        self._emit("cachehit", time.perf_counter() - start, link=link, bytes=size)
+
+    def _partmode(self, link: str, partpath: str, status: int, headers, offset: int, digest) -> str:
+        """
+        Utility function to get how to write the response to a download into partpath from its status:
+        appended ('ab') if it is the rest of an interrupted download, or overwriting it ('wb') if it is the whole file
+        If the response cannot be used, returns None
+
+        :param headers: The response's headers
+        :param offset: Number of bytes already downloaded (None if the download is not resumed)
+        :param digest: Hash object to feed what was already downloaded to
+        """
+        if status == 206 and offset is not None and self._rangestart(headers) == offset:
+            self._hashfile(digest, partpath)
+            return 'ab'
+        if status == 200:
+            self._beginpart(link, partpath, headers)
+            return 'wb'
+        if status in (206, 416):
+            # The server does not agree on what was already downloaded, so start over next time
+            self._discardpart(partpath)
+        return None
+
+    def _finishdownload(self, link: str, partpath: str, headers, encoding: str) -> None:
+        """
+        Utility function to mark a download complete, so it is never resumed, and store it in the cache
+
+        :param headers: The response's headers
+        :param encoding: Text encoding of the response body
+        """
+        self._discardpart(partpath, keepdata=True)
+        if self.cache is not None:
+            try:
+                self.cache.storefile(link, partpath, etag=headers.get("ETag"),
+                                     lastmodified=headers.get("Last-Modified"), encoding=encoding)
+            except OSError:
+                pass
+
+    def getmanifest(self, errormessage: str=None) -> dict:
+        """
+        Gets and verifies the manifest at manifestlink
+
+        :param errormessage: Error message to print if request fails. If errormessage is None,
+        no error messages will be printed
+        :raises requests.exceptions.RequestException (an OSError): If http request to remote github repository fails
+        :raises IntegrityError: If the manifest is malformed or its signature is invalid
+        """
+        success, text = self._getrequest(self.manifestlink, errormessage=errormessage)
+        if not success:
+            raise self._requestfailure(f"Request to {self.manifestlink} failed.")
+        return _parsemanifest(text, self.publickey)
+
+    def update(self, version: str=None) -> str:
+        """
+        Edits current script to latest version on remote github repository.
+        The script is streamed to a temporary file next to the current script, which then atomically replaces
+        it, so the current script is never left partially written.
+        If manifestlink is specified, the script is downloaded from the manifest's links (trying each in turn)
+        and verified against the manifest before it is installed. If the manifest publishes a delta from the
+        current version, only the delta is downloaded and applied to the current script, falling back to
+        downloading the whole script if the result does not match the manifest's sha256.
+        Only one process at a time can update the script. Processes that try to update it while another is
+        doing so wait for it (for up to locktimeout seconds), and do not download the script again if it
+        installed the same version.
+        Changes will be applied on next run.
+
+        :param version: The version being installed. Defaults to the manifest's version, if there is one
+        :return: The sha256 hex digest of the installed script
+        :raises requests.exceptions.RequestException (an OSError): If http request to remote github repository fails
+        :raises IntegrityError: If the manifest or the downloaded script fails verification
+        :raises TimeoutError: If another process is still updating the script after locktimeout seconds
+        """
+        with self._reportoutcome("update", version=version) as outcome:
+            manifest, self._manifest = self._manifest, None
+            if manifest is None and self.manifestlink:
+                manifest = self.getmanifest()
+            if version is None and manifest is not None:
+                version = outcome["version"] = manifest.get("version")
+            lock = FileLock(self.lockpath)
+            if not self._acquirelock(lock):
+                return self._lockbusy(version, outcome)
+            try:
+                digest = self._installedby(version)
+                if digest is None:
+                    digest = self._install(manifest)
+                    self._recordinstall(digest, version)
+                    outcome["outcome"] = "installed"
+                else:
+                    outcome["outcome"] = "alreadyinstalled"
+            finally:
+                lock.release()
+                self._savemirrors()
+        return digest
+
+    def _lockbusy(self, version: str, outcome: dict) -> str:
+        """
+        Utility function to finish update() when another process held the lock for more than locktimeout seconds
+        If that process installed the same version, its result is used
+
+        :param outcome: Fields of the update's outcome event
+        :return: The sha256 hex digest of the installed script
+        :raises TimeoutError: If it did not install the same version
+        """
+        digest = self._installedby(version)
+        if digest is None:
+            raise TimeoutError(f"Another process is still updating {self.scriptname}")
+        outcome["outcome"] = "alreadyinstalled"
+        return digest
+
+    @contextlib.contextmanager
+    def _reportoutcome(self, name: str, **fields):
+        """
+        Utility context manager to time a block and report its outcome to the observers
+        Yields a dict of fields for the block to fill in. If the block raises, its outcome is reported as failed
+
+        :param name: Name of the event to report
+        """
+        start = time.perf_counter()
+        try:
+            yield fields
+        except Exception as err:
+            self._emit(name, time.perf_counter() - start, **{**fields, "outcome": "failed", "error": str(err)})
+            raise
+        self._emit(name, time.perf_counter() - start, **fields)
+
+    def _acquirelock(self, lock: FileLock) -> bool:
+        """
+        Utility function to wait for the update lock for up to locktimeout seconds, timing the wait for the
+        observers
+
+        :return: Whether the lock was acquired
+        """
+        start = time.perf_counter()
+        acquired = lock.acquire(timeout=self.locktimeout)
+        self._emit("lockwait", time.perf_counter() - start, acquired=acquired)
+        return acquired
+
+    def _installedby(self, version: str) -> str:
+        """
+        Utility function to check whether another process has already installed a version
+        If it has not (or version is None), returns None
+
+        :return: The sha256 hex digest of the installed script
+        """
+        if version is None:
+            return None
+        state = self.state.load()
+        if state.get("installedversion") != version or not state.get("scriptdigest"):
+            return None
+        return state["scriptdigest"] if self.checkintegrity(state["scriptdigest"]) else None
+
+    def _install(self, manifest: dict) -> str:
+        """
+        Utility function to download the script and atomically install it
+
+        :param manifest: Manifest to take the script's links from and verify the script against (may be None)
+        :return: The sha256 hex digest of the installed script
+        """
+        self._checkverifiable(manifest)
+        start = time.perf_counter()
+        timings = {}
+        delta = self._deltafor(manifest)
+        if delta is not None:
+            try:
+                response = self._timedget(delta["link"])[0]
+            except OSError:
+                response = None
+            if response is not None and response.status_code == 200:
+                digest = self._installdelta(manifest, delta, response.content, timings)
+                if digest is not None:
+                    self._reportinstall("delta", start, timings)
+                    return digest
+        partpath = self.scriptpath + self._PARTSUFFIX
+        digest = self._downloadany(self._scriptlinks(manifest), partpath)
+        self._commitpart(partpath, self.scriptpath, manifest, digest, timings)
+        self._reportinstall("full", start, timings)
+        return digest
+
+    def _checkverifiable(self, manifest: dict) -> None:
+        """
+        Utility function to refuse to install the script from a signed manifest that does not publish its sha256,
+        since the signature would then vouch for nothing that is downloaded
+
+        :raises IntegrityError: If publickey is set and the manifest has no sha256
+        """
+        if manifest is not None and self.publickey is not None and not manifest.get("sha256"):
+            raise IntegrityError(f"{self.manifestlink} does not publish the script's sha256, so the script "
+                                 f"cannot be verified against the signed manifest")
+
+    def _downloadany(self, links: list, partpath: str) -> str:
+        """
+        Utility function to stream the first of links (or of their mirrors) that can be downloaded into a staging file
+        A download that is interrupted partway through the response body is resumed (or restarted, if none of it
+        was kept) from the same link, up to retries times, before failing over to the next one
+
+        :param links: Links to try, in order of preference
+        :param partpath: Path of the staging file to write the response body to
+        :return: The sha256 hex digest of the response body
+        :raises requests.exceptions.RequestException (an OSError): If every link fails
+        """
+        links = list(dict.fromkeys(mirrorlink for link in links for mirrorlink in self._mirrorlinks(link)))
+        for index, link in enumerate(links):
+            resumes = 0
+            while True:
+                progress = {}
+                try:
+                    return self._download(link, partpath, progress=progress)
+                except OSError:
+                    if self._shouldresume(progress, resumes):
+                        resumes += 1
+                        continue
+                    self._recordmirror(link, failed=True)
+                    if index == len(links) - 1:
+                        raise
+                    break
+
+    def _shouldresume(self, progress: dict, resumes: int) -> bool:
+        """
+        Utility function to decide whether to resume an interrupted download from the same link rather than
+        failing over to the next one: only if the transfer was interrupted (rather than the request failing),
+        and up to retries times
+
+        :param progress: The progress dict the download was made with
+        :param resumes: Number of times the download was already resumed
+        """
+        return resumes < self.retries and bool(progress.get("started"))
+
+    def _commitpart(self, partpath: str, path: str, manifest: dict, digest: str, timings: dict=None) -> None:
+        """
+        Utility function to verify a completely downloaded staging file and atomically move it to path
+        If the staging file fails verification, it is removed, so the next download starts over
+
+        :param manifest: Manifest (or manifest entry) to verify the file against (may be None)
+        :param digest: The sha256 hex digest of the staging file
+        :raises IntegrityError: If the staging file fails verification
+        """
+        try:
+            if manifest is not None:
+                _checkdownload(manifest, digest, os.path.getsize(partpath))
+            if self._shouldcompile(path):
+                _compileto(partpath, path)
+        except Exception:
+            self._discardpart(partpath)
+            raise
+        _commitfile(partpath, path, timings)
+
+    def _reportinstall(self, method: str, start: float, timings: dict, size: int=None, path: str=None) -> None:
+        """
+        Utility function to report an install and the time it spent in fsync to the observers
+
+        :param method: How the files were installed ("delta", "full" or "files")
+        :param start: time.perf_counter() when the install started
+        :param timings: Dict the time spent in fsync was stored in (by _atomicreplace)
+        :param size: Number of bytes installed. Defaults to the size of the script
+        :param path: Path of what was installed. Defaults to the script
+        """
+        if not self.observers:
+            return
+        path = path if path else self.scriptpath
+        if size is None:
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                pass
+        if "fsync" in timings:
+            self._emit("fsync", timings["fsync"], path=path)
+        self._emit("install", time.perf_counter() - start, method=method, bytes=size)
+
+    def _shouldcompile(self, path: str) -> bool:
+        """
+        Utility function to get whether a file should be compiled to bytecode before it is installed
+        """
+        return bool(self.precompile) and path.endswith(".py")
+
+    def _deltafor(self, manifest: dict) -> dict:
+        """
+        Utility function to get the manifest's delta from the current version to the latest version
+        Deltas are only used if the manifest publishes the sha256 of the latest version, to verify the result with
+        If there is no usable delta, returns None
+        """
+        if manifest is None or not manifest.get("sha256") or not manifest.get("deltas"):
+            return None
+        delta = manifest["deltas"].get(self.currentversion)
+        if isinstance(delta, str):
+            delta = {"link": delta}
+        if not isinstance(delta, dict) or not delta.get("link"):
+            return None
+        return delta
+
+    def _installdelta(self, manifest: dict, delta: dict, patch: bytes, timings: dict=None) -> str:
+        """
+        Utility function to patch the current script with a delta and atomically install the result
+        If the delta does not apply, or the result does not match the manifest's sha256, nothing is installed
+        and None is returned, so the caller can fall back to downloading the whole script
+
+        :param timings: Dict to store the number of seconds spent in fsync in, under "fsync"
+        :return: The sha256 hex digest of the installed script
+        """
+        import hashlib
+        if delta.get("sha256") and hashlib.sha256(patch).hexdigest() != delta["sha256"].lower():
+            return None
+        try:
+            with open(self.scriptpath, 'rb') as f:
+                original = f.read()
+            patched = _applydelta(original, patch, delta.get("format", "unified"))
+        except (OSError, ValueError):
+            return None
+        digest = hashlib.sha256(patched).hexdigest()
+        try:
+            _checkdownload(manifest, digest, len(patched))
+        except IntegrityError:
+            return None
+        with _atomicreplace(self.scriptpath, timings) as f:
+            f.write(patched)
+            if self._shouldcompile(self.scriptpath):
+                f.flush()
+                _compileto(f.name, self.scriptpath)
+        return digest
+
+    def _recordinstall(self, digest: str, version: str=None) -> None:
+        """
+        Utility function to persist the digest and version of a freshly installed script,
+        for checkintegrity and for other processes updating the same script
+        """
+        try:
+            self.state.update(scriptdigest=digest, installedversion=version)
+        except OSError:
+            pass
+
+    _JOURNALNAME = ".pythonautoupdate-journal.json"
+    _STAGEDSUFFIX = ".pythonautoupdate-staged"
+
+    def updatefiles(self, maxworkers: int=None) -> dict:
+        """
+        Updates every file of a project listed in the manifest's files to its latest version.
+        The manifest maps paths relative to rootdir to their sha256 (and optionally their size and link):
+
+        "files": {"package/module.py": {"sha256": "...", "size": 123, "link": "https://..."}}
+
+        Files without a link are downloaded from the manifest's baselink followed by their path.
+        Only files whose sha256 differs from the local copy are downloaded. Downloads run concurrently and are
+        verified and staged in objectsdir (named by their sha256, so a file is never downloaded twice).
+        Once every changed file is staged, they are all swapped in together. The swap is journaled, so if it
+        is interrupted, the next call finishes it before doing anything else.
+        Like update(), only one process at a time can update the project.
+        Changes will be applied on next run.
+
+        :param maxworkers: Maximum number of concurrent downloads. Defaults to poolsize
+        :return: Dict mapping the path of each updated file to its sha256 hex digest
+        :raises requests.exceptions.RequestException (an OSError): If http request to remote github repository fails
+        :raises IntegrityError: If the manifest or a downloaded file fails verification
+        :raises TimeoutError: If another process is still updating the project after locktimeout seconds
+        """
+        with self._reportoutcome("update", version=None) as outcome:
+            manifest, self._manifest = self._manifest, None
+            if manifest is None:
+                manifest = self.getmanifest()
+            outcome["version"] = manifest.get("version")
+            from concurrent.futures import ThreadPoolExecutor
+            files = self._plannedfiles(manifest)
+            lock = FileLock(self.lockpath)
+            if not self._acquirelock(lock):
+                raise TimeoutError(f"Another process is still updating {self.scriptname}")
+            try:
+                self._recoverfiles()
+                with ThreadPoolExecutor(max_workers=maxworkers or self.poolsize) as executor:
+                    changed = [file for file, unchanged in zip(files, executor.map(self._isunchanged, files))
+                               if not unchanged]
+                    # list() so the first failed download is raised here
+                    list(executor.map(self._fetchobject, self._uniqueobjects(changed)))
+                self._installfiles(changed)
+            finally:
+                lock.release()
+                self._savemirrors()
+        return self._updatedfiles(changed, outcome)
+
+    @staticmethod
+    def _updatedfiles(changed: list, outcome: dict) -> dict:
+        """
+        Utility function to get what updatefiles() returns, and record its outcome
+
+        :param changed: The files that were downloaded and swapped in
+        :param outcome: Fields of the update's outcome event
+        """
+        outcome["outcome"] = "installed" if changed else "alreadyinstalled"
+        return {file["path"]: file["sha256"] for file in changed}
+
+    def _installfiles(self, files: list) -> None:
+        """
+        Utility function to swap staged files into rootdir together, timing it for the observers
+        """
+        start = time.perf_counter()
+        timings = {}
+        self._swapfiles(files, timings)
+        if files and self.observers:
+            size = sum(os.path.getsize(self._objectpath(file["sha256"])) for file in files)
+            self._reportinstall("files", start, timings, size=size, path=self.rootdir)
+
+    def _plannedfiles(self, manifest: dict) -> list:
+        """
+        Utility function to validate the files listed in a manifest and resolve their local paths and links
+
+        :return: List of dicts with the path, target (absolute local path), link, sha256 and size of each file
+        :raises IntegrityError: If the manifest does not list files, or lists a file outside rootdir
+        """
+        if not manifest.get("files"):
+            raise IntegrityError(f"{self.manifestlink} does not list any files")
+        root = os.path.abspath(self.rootdir)
+        baselink = manifest.get("baselink", "")
+        files = []
+        for path, entry in manifest["files"].items():
+            if isinstance(entry, str):
+                entry = {"sha256": entry}
+            if not isinstance(entry, dict) or not isinstance(entry.get("sha256"), str):
+                raise IntegrityError(f"Manifest entry for {path} must have a sha256")
+            target = os.path.abspath(os.path.join(root, path))
+            if os.path.isabs(path) or os.path.commonpath([root, target]) != root or target == root:
+                raise IntegrityError(f"Manifest lists a file outside of {root}: {path}")
+            if entry.get("link"):
+                link = entry["link"]
+            elif baselink:
+                link = baselink.rstrip("/") + "/" + path.replace(os.sep, "/").lstrip("/")
+            else:
+                raise IntegrityError(f"Manifest entry for {path} has no link, and the manifest has no baselink")
+            files.append({"path": path, "target": target, "link": link, "sha256": entry["sha256"].lower(),
+                          "size": entry.get("size")})
+        return files
+
+    @staticmethod
+    def _isunchanged(file: dict) -> bool:
+        """
+        Utility function to check whether the local copy of a file already matches the manifest
+        """
+        try:
+            if file["size"] is not None and os.path.getsize(file["target"]) != file["size"]:
+                return False
+            return _filedigest(file["target"]) == file["sha256"]
+        except OSError:
+            return False
+
+    @staticmethod
+    def _uniqueobjects(files: list) -> list:
+        """
+        Utility function to get one of each set of files with the same contents, so identical files are only
+        downloaded once (and two downloads never write the same staging file at the same time)
+        """
+        return list({file["sha256"]: file for file in files}.values())
+
+    def _objectpath(self, sha256: str) -> str:
+        """
+        Utility function to get the path a file is staged at in objectsdir
+        """
+        return os.path.join(self.objectsdir, sha256[:2], sha256)
+
+    def _fetchobject(self, file: dict) -> None:
+        """
+        Utility function to download a file into objectsdir and verify it, unless it is already there
+        """
+        objectpath = self._objectpath(file["sha256"])
+        if os.path.isfile(objectpath):
+            return
+        lock = self._lockobject(file)
+        try:
+            # Another process may have staged it while we waited for the lock
+            if os.path.isfile(objectpath):
+                return
+            partpath = objectpath + self._PARTSUFFIX
+            self._downloadany([file["link"]], partpath)
+            self._commitobject(partpath, objectpath, file)
+        finally:
+            lock.release()
+
+    def _lockobject(self, file: dict) -> FileLock:
+        """
+        Utility function to lock a file's object in objectsdir, which every project of the user shares by default,
+        so two processes never write the same staging file at the same time
+
+        :return: The acquired lock
+        :raises TimeoutError: If another process is still downloading the file after locktimeout seconds
+        """
+        objectpath = self._objectpath(file["sha256"])
+        os.makedirs(os.path.dirname(objectpath), exist_ok=True)
+        lock = FileLock(objectpath + ".lock")
+        if not lock.acquire(timeout=self.locktimeout):
+            raise TimeoutError(f"Another process is still downloading {file['path']}")
+        return lock
+
+    def _commitobject(self, partpath: str, objectpath: str, file: dict) -> None:
+        """
+        Utility function to verify a downloaded object by the bytes on disk, rather than the bytes that were
+        streamed into it, and move it into objectsdir
+
+        :raises IntegrityError: If the staging file fails verification
+        """
+        self._commitpart(partpath, objectpath, file, _filedigest(partpath))
+
+    def _swapfiles(self, files: list, timings: dict=None) -> None:
         """
-        Initializes updatehandler class.
+        Utility function to swap staged files into rootdir together
+        Every file is first copied next to its target, then the journal is written, then every copy is renamed
+        over its target. If the process dies during the renames, _recoverfiles finishes them
 
-        :param repolink: Root link to the github repository
-        :param scriptname: The name of the current script
-        :param versionlink: Link to the version.txt file in the github repository
-        :param whatsnewlink: Link to the whatsnew.txt file in the github repository
-        :param scriptlink: Link to the script file in the github repository
+        :param timings: Dict to store the number of seconds spent in fsync in, under "fsync"
+        """
+        import shutil
+        if not files:
+            return
+        for file in files:
+            os.makedirs(os.path.dirname(file["target"]), exist_ok=True)
+            staged = file["target"] + self._STAGEDSUFFIX
+            with open(self._objectpath(file["sha256"]), 'rb') as source, open(staged, 'wb') as f:
+                shutil.copyfileobj(source, f)
+                f.flush()
+                _timedfsync(f.fileno(), timings)
+            try:
+                os.chmod(staged, os.stat(file["target"]).st_mode & 0o7777)
+            except OSError:
+                pass
+        try:
+            self._compilestaged([file["target"] for file in files if self._shouldcompile(file["target"])])
+        except BaseException:
+            for file in files:
+                try:
+                    os.remove(file["target"] + self._STAGEDSUFFIX)
+                except OSError:
+                    pass
+            raise
+        journalpath = os.path.join(self.rootdir, self._JOURNALNAME)
+        journal = [{"path": file["path"], "sha256": file["sha256"]} for file in files]
+        with _atomicreplace(journalpath, timings) as f:
+            f.write(json.dumps(journal).encode("utf-8"))
+        self._recoverfiles()
 
-        If not specified, scriptname, versionlink, whatsnewlink, and scriptlink will be automatically generated
-        If importing as a module, make sure you specify scriptname - if you don't, it will default to the name
-        of this module
+    def _compilestaged(self, targets: list) -> None:
         """
-        self.repolink = repolink
-        rawrepolink = repolink.replace("https://github.com","https://raw.githubusercontent.com")
-        if not scriptname:
-            scriptname = os.path.basename(__file__)
-        if not versionlink:
-            versionlink = rawrepolink + "/master/version.txt"
-        if not whatsnewlink:
-            whatsnewlink = rawrepolink + "/master/whatsnew.txt"
-        if not scriptlink:
-            scriptlink = rawrepolink + f"/master/{scriptname}"
-        self.scriptname = scriptname
-        self.versionlink = versionlink
-        self.whatsnewlink = whatsnewlink
-        self.scriptlink = scriptlink
+        Utility function to compile the staged copies of python files to bytecode for their targets
+        Files are compiled in this process: worker processes would cost more to start than compiling a few files,
+        and under the spawn start method they would rerun the top level of a script that embeds this module
 
-    @staticmethod
-    def _getrequest(link: str, errormessage: str = None) -> (int, str):
+        :raises py_compile.PyCompileError: If a file does not compile
         """
-        Utility function to make http get request
-        If request fails, returns (None, None)
+        for target in targets:
+            _compileto(target + self._STAGEDSUFFIX, target)
+
+    def _recoverfiles(self) -> None:
+        """
+        Utility function to finish a journaled swap of staged files into rootdir, if there is one
+        """
+        import shutil
+        journalpath = os.path.join(self.rootdir, self._JOURNALNAME)
+        try:
+            with open(journalpath, 'r') as f:
+                journal = json.load(f)
+        except (OSError, ValueError):
+            return
+        for entry in journal:
+            target = os.path.join(self.rootdir, entry["path"])
+            staged = target + self._STAGEDSUFFIX
+            if os.path.exists(staged):
+                os.replace(staged, target)
+            elif not self._isunchanged({"target": target, "sha256": entry["sha256"], "size": None}):
+                # The staged copy is gone but the target was never replaced, so restage it
+                with open(self._objectpath(entry["sha256"]), 'rb') as source, _atomicreplace(target) as f:
+                    shutil.copyfileobj(source, f)
+        os.remove(journalpath)
+
+    def localdigest(self) -> str:
+        """
+        Gets the sha256 hex digest of the local script, without reading it all into memory
+        """
+        return _filedigest(self.scriptpath)
+
+    def checkintegrity(self, expected: str=None) -> bool:
+        """
+        Checks whether the local script is intact by comparing its sha256 digest against an expected digest.
+
+        :param expected: Expected sha256 hex digest. Defaults to the digest recorded when update() last installed
+        the script
+        :return: Whether the digests match, or None if there is no expected digest to compare against
+        """
+        if expected is None:
+            expected = self.state.get("scriptdigest")
+            if expected is None:
+                return None
+        try:
+            return self.localdigest() == expected.lower()
+        except OSError:
+            return False
+
+    def _fetchupdateinfo(self, errormessage: str=None) -> (str, str):
+        """
+        Utility function to get the latest version and its changelog from remote github repository
+        If the last check was made within checkinterval, they are read from the persisted state instead
+        If the version cannot be retrieved, returns (None, None)
 
-        :param link: Link to make request to
         :param errormessage: Error message to print if request fails. If errormessage is None,
         no error messages will be printed
+        :return: The latest version, and its changelog (None if the changelog cannot be retrieved)
+        """
+        start = time.perf_counter()
+        throttled = self._throttledinfo()
+        if throttled is not None:
+            self._reportcheck(start, throttled[0], throttled=True)
+            return throttled
+        # Every request of the check (and its retries and mirrors) shares one budget
+        deadline = self._deadline()
+        link, *otherlinks = self._checklinks()
+        if otherlinks:
+            from concurrent.futures import ThreadPoolExecutor
+            # The changelog is fetched alongside the version so an available update costs one round-trip
+            with ThreadPoolExecutor(max_workers=len(otherlinks)) as executor:
+                otherrequests = [executor.submit(self._getrequest, otherlink, errormessage=None, deadline=deadline)
+                                 for otherlink in otherlinks]
+                responses = {link: self._getrequest(link, errormessage=errormessage, deadline=deadline)}
+                responses.update(zip(otherlinks, (request.result() for request in otherrequests)))
+        else:
+            responses = {link: self._getrequest(link, errormessage=errormessage, deadline=deadline)}
+        cloudversion, whatsnew = self._parseupdateinfo(responses, errormessage)
+        self._savemirrors()
+        self._reportcheck(start, cloudversion)
+        return cloudversion, whatsnew
+
+    def _reportcheck(self, start: float, cloudversion: str, throttled: bool=False) -> None:
+        """
+        Utility function to report the outcome of an update check to the observers
+
+        :param start: time.perf_counter() when the check started
+        :param cloudversion: The latest version found by the check (None if the check failed)
+        :param throttled: Whether the check was decided from the persisted state
+        """
+        if not self.observers:
+            return
+        if cloudversion is None:
+            outcome = "failed"
+        else:
+            outcome = "updateavailable" if self._updateavailable(cloudversion) else "uptodate"
+        self._emit("check", time.perf_counter() - start, outcome=outcome, throttled=throttled,
+                   cloudversion=cloudversion)
+
+    def _checklinks(self) -> list:
+        """
+        Utility function to get the links an update check requests
+        The first link is the one the check fails without
+        """
+        if self.manifestlink:
+            return [self.manifestlink]
+        return [self.versionlink, self.whatsnewlink]
+
+    def _parseupdateinfo(self, responses: dict, errormessage: str=None) -> (str, str):
+        """
+        Utility function to get the latest version and its changelog from the responses to an update check,
+        and persist them if checks are throttled
+        If the version cannot be retrieved, returns (None, None)
+
+        :param responses: Dict mapping each of the links returned by _checklinks to its (success, text)
+        :param errormessage: Error message to print if the manifest is invalid. If errormessage is None,
+        no error messages will be printed
         """
-        if "requests" in globals():
+        if self.manifestlink:
+            success, text = responses[self.manifestlink]
+            if not success:
+                return None, None
             try:
-                response = requests.get(link)
-            except Exception:
+                manifest = _parsemanifest(text, self.publickey)
+            except IntegrityError as err:
                 if errormessage is not None:
-                    print(f"{errormessage}: Get request to {link} failed")
-            else:
-                if response.status_code != 200:
-                    if errormessage is not None:
-                        print(f"{errormessage}:"
-                              f" {link}"
-                              " returned http status code"
-                              f" {str(response.status_code)}")
-        return (response.status_code == 200, response.text) if "response" in locals() else (None, None)
-
-    def _checkcorrupted(self, currentcode: str) -> None:
-        """
-        Checks if current script has been corrupted.
-        If if has, attempts to repair it.
-        Changes will be applied on next run.
+                    print(f"{errormessage}: {err}")
+                return None, None
+            cloudversion, whatsnew = self._manifestinfo(manifest, errormessage)
+        else:
+            success, text = responses[self.versionlink]
+            if not success:
+                return None, None
+            changelogsuccess, changelog = responses[self.whatsnewlink]
+            cloudversion = text.strip()
+            whatsnew = changelog.strip() if changelogsuccess else None
+        self._savecheck(cloudversion, whatsnew)
+        return cloudversion, whatsnew
 
-        :param currentcode: The code of the current script to repair to if necessary
-         (it is the caller's responsibility to obtain this variable before attempting anything
-         that may corrupt the script)
+    def _throttledinfo(self) -> (str, str):
         """
-        with open(__file__, 'r+') as f:
-            if f.read() != currentcode:
-                print(f"{self.scriptname} has been corrupted. Attempting to repair...")
-                try:
-                    f.write(currentcode)
-                except Exception:
-                    # We use sys.exit because we do not want this exception to be caught
-                    sys.exit(f"Failed to repair {self.scriptname}.")
-                else:
-                    print(f"Successfully repaired {self.scriptname}. Rerun the script.")
-                    sys.exit()
+        Utility function to get the result of the last update check from the persisted state
+        If the last check was not made within checkinterval (or was made to a different link), returns None
+        """
+        if self.checkinterval > 0:
+            state = self.state.load()
+            if (state.get("cloudversion") is not None and state.get("checklink") == self._checklinks()[0]
+                    and 0 <= time.time() - state.get("lastcheck", 0) < self.checkinterval):
+                return state["cloudversion"], state.get("whatsnew")
+        return None
 
-    @staticmethod
-    def ignoreversion(version: str) -> None:
+    def _savecheck(self, cloudversion: str, whatsnew: str) -> None:
         """
-        Edits current script to ignore specified version when checking for updates.
-        Changes will be applied on next run.
+        Utility function to persist the result of an update check, if checks are throttled
+        """
+        if self.checkinterval > 0 and cloudversion is not None:
+            try:
+                self.state.update(lastcheck=time.time(), checklink=self._checklinks()[0], cloudversion=cloudversion,
+                                  whatsnew=whatsnew)
+            except OSError:
+                pass
 
-        :param version: Version to ignore
+    def _manifestinfo(self, manifest: dict, errormessage: str=None) -> (str, str):
+        """
+        Utility function to get the latest version and its changelog from a manifest,
+        and keep the manifest for update()
+        If the manifest does not publish a version, returns (None, None)
+        """
+        if not manifest.get("version"):
+            if errormessage is not None:
+                print(f"{errormessage}: {self.manifestlink} does not specify a version")
+            return None, None
+        self._manifest = manifest
+        whatsnew = manifest.get("whatsnew")
+        return manifest["version"].strip(), whatsnew.strip() if whatsnew is not None else None
+
+    def _scriptlinks(self, manifest: dict) -> list:
+        """
+        Utility function to get the links to download the script from, in order of preference
         """
-        with open(__file__, 'r') as f:
-            currentcode = f.read()
-        with open(__file__, 'w') as f:
-            new = re.sub("\n_IGNOREVERSION = .*\n", f"\n_IGNOREVERSION = \"{version}\"\n", currentcode)
-            f.write(new)
+        if manifest is not None and manifest.get("scriptlink"):
+            links = manifest["scriptlink"]
+            return [links] if isinstance(links, str) else list(links)
+        return [self.scriptlink]
+
+    def getupdateinfo(self) -> UpdateInfo:
+        """
+        Checks for updates to the current script on remote github repository without interacting with the user.
+        If the check fails, returns None
+        """
+        cloudversion, whatsnew = self._fetchupdateinfo(errormessage=None)
+        if cloudversion is None:
+            return None
+        return UpdateInfo(cloudversion, whatsnew, self._updateavailable(cloudversion))
 
     @staticmethod
-    def disableupdatechecking() -> None:
+    def _resolve(future: "Future", result=None, exception: BaseException=None) -> None:
         """
-        Edits current script to disable update checking.
-        Changes will be applied on next run.
+        Utility function to resolve a future that may already have been resolved by another thread
         """
-        with open(__file__, 'r') as f:
-            currentcode = f.read()
-        with open(__file__, 'w') as f:
-            new = currentcode.replace("\n_UPDATECHECKING = True\n", "\n_UPDATECHECKING = False\n")
-            f.write(new)
+        from concurrent.futures import InvalidStateError
+        try:
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(result)
+        except InvalidStateError:
+            pass
 
-    def update(self) -> None:
+    def checkinbackground(self, callback: "Callable[[UpdateInfo], None]"=None, deadline: float=5,
+                          reportatexit: bool=False) -> "Future":
         """
-        Edits current script to latest version on remote github repository.
-        Changes will be applied on next run.
+        Checks for updates to the current script on remote github repository on a daemon thread,
+        so the check never delays the program.
+        Does not interact with the user.
+
+        :param callback: Function to call with the UpdateInfo once the check is done
+        (or with None if the check fails or misses the deadline). It is called on a background thread
+        :param deadline: Number of seconds the check is allowed to take. If it takes longer, its result is
+        discarded. If deadline is None, the check is only bounded by timeout
+        :param reportatexit: Whether to tell the user about an available update when the program exits
+        :return: Future that resolves to the UpdateInfo, or raises if the check fails or misses the deadline
+        """
+        import atexit
+        import threading
+        from concurrent.futures import Future
+        future = Future()
+
+        def check():
+            try:
+                self._resolve(future, result=self.getupdateinfo())
+            except Exception as err:
+                self._resolve(future, exception=err)
+
+        threading.Thread(target=check, name=f"{self.scriptname} update check", daemon=True).start()
+        if deadline is not None:
+            timer = threading.Timer(deadline, self._resolve, args=(future,),
+                                    kwargs={"exception": TimeoutError(
+                                        f"Update check did not finish within {deadline} seconds")})
+            timer.daemon = True
+            timer.start()
+        if callback is not None:
+            future.add_done_callback(lambda done: callback(None if done.exception() else done.result()))
+        if reportatexit:
+            atexit.register(self.reportupdate, future)
+        return future
+
+    def reportupdate(self, future: "Future", deadline: float=0) -> UpdateInfo:
+        """
+        Tells the user about an available update found by checkinbackground.
+        Does not prompt the user, so it is safe to call at exit.
+
+        :param future: Future returned by checkinbackground
+        :param deadline: Number of seconds to wait for the check to finish
+        :return: The UpdateInfo, or None if the check failed or is not done
+        """
+        try:
+            info = future.result(timeout=deadline)
+        except Exception:
+            return None
+        if info is not None and info.updateavailable:
+            self._announceupdate(info)
+        return info
+
+    def _announceupdate(self, info: UpdateInfo, explainmissing: bool=False) -> None:
+        """
+        Utility function to tell the user about an available update
+
+        :param explainmissing: Whether to say why the changelog is missing, if it is
+        """
+        print(f"{self.scriptname} has an update! {self.repolink}")
+        if info.whatsnew is not None:
+            print(f"What's new in version {info.cloudversion}: {info.whatsnew}")
+        elif explainmissing and self.manifestlink:
+            print(f"Unable to retrieve changelog for update: The manifest at {self.manifestlink} has no changelog")
+        elif explainmissing:
+            print(f"Unable to retrieve changelog for update: Get request to {self.whatsnewlink} failed")
+
+    def _ignoreversionverbosely(self, version: str) -> None:
+        """
+        Utility function to ignore a version, telling the user whether it worked
+        """
+        try:
+            self.ignoreversion(version)
+        except Exception as err:
+            print("Failed to permanently ignore this version: " + str(err))
+        else:
+            print("Successfully ignored this version!")
 
-        :raises requests.exceptions.RequestException: If http request to remote github repository fails
+    def _disableupdatecheckingverbosely(self) -> None:
         """
-        success, text = self._getrequest(self.scriptlink, errormessage=None)
-        if success:
-            with open(__file__, 'w') as f:
-                f.write(text)
+        Utility function to disable update checking, telling the user whether it worked
+        """
+        try:
+            self.disableupdatechecking()
+        except Exception as err:
+            print("Failed to permanently disable update checking: " + str(err))
         else:
-            raise requests.exceptions.RequestException(f"Request to {self.scriptlink} failed.")
+            print("Successfully disabled update checking!")
 
     def checkforupdates(self, silentlyfail=True) -> None:
         """
@@ -145,48 +2563,24 @@ class UpdateHandler:
         :raises sys.exit: If changes to script are made
         """
         errormessage = None if silentlyfail else f"{self.scriptname}: Unable to check for updates"
-        success, text = self._getrequest(self.versionlink,
-                                         errormessage=errormessage)
-        if success:
-            cloudversion = text.strip()
-            if not (cloudversion == __version__ or cloudversion == _IGNOREVERSION):
-                print(f"{self.scriptname} has an update! {self.repolink}")
-                success, text = self._getrequest(self.whatsnewlink,
-                                                 errormessage=f"Unable to retrieve changelog for update")
-                if success:
-                    whatsnew = text.strip()
-                    print(f"What's new in version {cloudversion}: {whatsnew}")
+        cloudversion, whatsnew = self._fetchupdateinfo(errormessage)
+        if cloudversion is not None:
+            info = UpdateInfo(cloudversion, whatsnew, self._updateavailable(cloudversion))
+            if info.updateavailable:
+                self._announceupdate(info, explainmissing=True)
                 toupdate = input("Would you like to update? (Y/N):")
                 if toupdate.strip().lower() == "y":
-                    with open(__file__, 'r') as f:
-                        currentcode = f.read()
                     try:
-                        self.update()
+                        self.update(cloudversion)
                     except Exception as err:
                         print("Update failed: " + str(err))
-                        try:
-                            self._checkcorrupted(currentcode)
-                        except Exception:
-                            pass
                     else:
                         print(f"Successfully updated {self.scriptname}! Rerun the script.")
                         sys.exit()
                 else:
                     toignore = input("Would you like to permanently ignore this version? (Y/N):")
                     if toignore.strip().lower() == "y":
-                        with open(__file__, 'r') as f:
-                            currentcode = f.read()
-                        try:
-                            self.ignoreversion(cloudversion)
-                        except Exception as err:
-                            print("Failed to permanently ignore this version: " + str(err))
-                            try:
-                                self._checkcorrupted(currentcode)
-                            except Exception:
-                                pass
-                        else:
-                            print(f"Successfully ignored this version! Rerun {self.scriptname}.")
-                            sys.exit()
+                        self._ignoreversionverbosely(cloudversion)
             else:
                 print("No updates found")
 
@@ -207,7 +2601,7 @@ class UpdateHandler:
 
         :raises sys.exit: If changes to script are made
         """
-        if not _UPDATECHECKING:
+        if not self.updatecheckingenabled():
             return
         tocheckforupdates = input(f"{self.scriptname}: Would you like to check for updates? (Y/N):")
         if tocheckforupdates.strip().lower() == "y":
@@ -215,16 +2609,650 @@ class UpdateHandler:
         else:
             todisable = input("Would you like to permanently disable update checking? (Y/N):")
             if todisable.strip().lower() == "y":
-                with open(__file__, 'r') as f:
-                    currentcode = f.read()
+                self._disableupdatecheckingverbosely()
+
+
+class AsyncUpdateHandler(UpdateHandler):
+    def __init__(self, repolink: str,
+                 scriptname: str=None, versionlink: str=None, whatsnewlink: str=None, scriptlink: str=None,
+                 session: "aiohttp.ClientSession"=None, poolsize: int=4, cache: ResponseCache=None,
+                 checkinterval: float=0, statefile: str=None, timeout: float=(5, 10), scriptpath: str=None,
+                 manifestlink: str=None, publickey: str=None, settingsfile: str=None, locktimeout: float=60,
+                 rootdir: str=None, objectsdir: str=None, currentversion: str=None, precompile: bool=False,
+                 observers: list=None, retries: int=2, backoff: float=0.5, maxbackoff: float=8,
+                 budget: float=30, mirrors: list=None, askuser: "Callable[[str], Awaitable[bool]]"=None):
+        """
+        Initializes asyncupdatehandler class.
+        Asyncio counterpart of UpdateHandler, which makes http requests with aiohttp and never blocks the
+        event loop. Requires the aiohttp package.
+
+        Takes the same parameters as UpdateHandler, except:
+
+        :param session: aiohttp.ClientSession to make http requests with. If not specified, one is created
+        on first use
+        :param askuser: Coroutine function that asks the user a Y/N question and returns whether they answered
+        yes. Defaults to asking with input() on a worker thread. The individual decisions can also be
+        customized by overriding confirmcheck, confirmupdate, confirmignore and confirmdisable
+        """
+        super().__init__(repolink, scriptname=scriptname, versionlink=versionlink, whatsnewlink=whatsnewlink,
+                         scriptlink=scriptlink, session=session, poolsize=poolsize, cache=cache,
+                         checkinterval=checkinterval, statefile=statefile, timeout=timeout,
+                         scriptpath=scriptpath, manifestlink=manifestlink, publickey=publickey,
+                         settingsfile=settingsfile, locktimeout=locktimeout, rootdir=rootdir, objectsdir=objectsdir,
+                         currentversion=currentversion, precompile=precompile, observers=observers,
+                         retries=retries, backoff=backoff, maxbackoff=maxbackoff, budget=budget, mirrors=mirrors)
+        if askuser is not None:
+            self.askuser = askuser
+
+    @staticmethod
+    def makesession(poolsize: int=4) -> None:
+        # aiohttp sessions must be created inside a running event loop, so the session is created on first use
+        return None
+
+    async def _getsession(self) -> "aiohttp.ClientSession":
+        """
+        Utility function to get the aiohttp session, creating it if necessary
+        """
+        if self.session is None:
+            import aiohttp
+            self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit_per_host=self.poolsize),
+                                                 timeout=self._clienttimeout(self.timeout))
+        return self.session
+
+    @staticmethod
+    def _clienttimeout(timeout, deadline: float=None) -> "aiohttp.ClientTimeout":
+        """
+        Utility function to convert a timeout (a number of seconds or a (connect, read) tuple) to an
+        aiohttp.ClientTimeout
+
+        :param deadline: time.monotonic() by which the request must be done (None for no deadline)
+        """
+        import aiohttp
+        if isinstance(timeout, tuple):
+            total = deadline - time.monotonic() if deadline is not None else None
+            return aiohttp.ClientTimeout(total=total, sock_connect=timeout[0], sock_read=timeout[1])
+        return aiohttp.ClientTimeout(total=timeout)
+
+    async def close(self) -> None:
+        """
+        Closes the http session and all of its pooled connections.
+        """
+        if self.session is not None:
+            await self.session.close()
+
+    def __enter__(self):
+        raise TypeError("Use async with for AsyncUpdateHandler, so its session is closed")
+
+    def __exit__(self, *exc):
+        raise TypeError("Use async with for AsyncUpdateHandler, so its session is closed")
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def _requestfailure(self, message: str) -> Exception:
+        """
+        Utility function to make the exception raised when an http request fails
+        """
+        import aiohttp
+        return aiohttp.ClientError(message)
+
+    async def _timedget(self, link: str, headers: dict=None, stream: bool=False,
+                        deadline: float=None) -> ("aiohttp.ClientResponse", float, float):
+        """
+        Utility function to make http get request, retrying it if it fails, and time it for the observers
+        Works like UpdateHandler._timedget. The caller must release the response (async with response)
+
+        :param deadline: time.monotonic() by which the request and its retries must be done (None for no deadline)
+        :return: The response, time.perf_counter() when the request was made, and the number of seconds until
+        the response headers arrived
+        :raises aiohttp.ClientError: If the request fails
+        :raises asyncio.TimeoutError: If the request times out
+        """
+        import asyncio
+        import aiohttp
+        session = await self._getsession()
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            status = ttfb = size = None
+            timeout = self._timeoutwithin(deadline)
+            try:
+                if timeout is None:
+                    raise self._requestfailure(f"Request to {link} ran out of time")
+                response = await session.get(link, headers=headers, timeout=self._clienttimeout(timeout, deadline))
+                status, ttfb = response.status, time.perf_counter() - start
+                if not stream or status in self._RETRYSTATUSES:
+                    size = len(await response.read())
+            except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+                delay = self._retryfailure(link, attempt, start, status, ttfb, err, timeout, deadline)
+                if delay is None:
+                    raise
+            else:
+                delay = self._retryresponse(link, attempt, start, status, ttfb, size,
+                                            response.headers.get("Retry-After"), stream, deadline)
+                if delay is None:
+                    return response, start, ttfb
+                response.release()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _getrequest(self, link: str, errormessage: str = None, deadline: float=None) -> (int, str):
+        """
+        Utility function to make http get request, failing over to the mirrors if it fails
+        If request fails, returns (None, None)
+
+        :param link: Link to make request to
+        :param errormessage: Error message to print if request fails. If errormessage is None,
+        no error messages will be printed
+        :param deadline: time.monotonic() by which the request must be done. Defaults to budget seconds from now
+        """
+        if deadline is None:
+            deadline = self._deadline()
+        for mirrorlink in self._mirrorlinks(link):
+            start = time.perf_counter()
+            status, text = await self._getfrom(mirrorlink, deadline)
+            if self._recordmirrorstatus(mirrorlink, status, start):
+                return True, text
+        return self._requestfailed(link, status, text, errormessage)
+
+    async def _getfrom(self, link: str, deadline: float=None) -> (int, str):
+        """
+        Utility function to make http get request to a single link, revalidating it with the cache
+        If request fails, returns (None, None)
+
+        :return: The http status code (200 if the response was answered from the cache) and the response text
+        """
+        import asyncio
+        loop = asyncio.get_running_loop()
+        headers = self.cache.conditionalheaders(link) if self.cache is not None else {}
+        try:
+            response = (await self._timedget(link, headers=headers, deadline=deadline))[0]
+            # The body was read by _timedget, so this does not wait for the server
+            async with response:
+                body, encoding = await response.read(), response.get_encoding()
+            if response.status == 304 and self.cache is not None:
+                text = await loop.run_in_executor(None, self._revalidated, link)
+                if text is not None:
+                    return 200, text
+                # The entry vanished since the request was made; fetch it unconditionally
+                response = (await self._timedget(link, deadline=deadline))[0]
+                async with response:
+                    body, encoding = await response.read(), response.get_encoding()
+        except Exception:
+            return None, None
+        await loop.run_in_executor(None, self._storeresponse, link, response.status, body, response.headers, encoding)
+        return response.status, body.decode(encoding, errors="replace")
+
+    async def _fetchupdateinfo(self, errormessage: str=None) -> (str, str):
+        """
+        Utility function to get the latest version and its changelog from remote github repository
+        If the last check was made within checkinterval, they are read from the persisted state instead
+        If the version cannot be retrieved, returns (None, None)
+
+        :param errormessage: Error message to print if request fails. If errormessage is None,
+        no error messages will be printed
+        :return: The latest version, and its changelog (None if the changelog cannot be retrieved)
+        """
+        start = time.perf_counter()
+        throttled = self._throttledinfo()
+        if throttled is not None:
+            self._reportcheck(start, throttled[0], throttled=True)
+            return throttled
+        import asyncio
+        # Every request of the check (and its retries and mirrors) shares one budget
+        deadline = self._deadline()
+        links = self._checklinks()
+        results = await asyncio.gather(self._getrequest(links[0], errormessage=errormessage, deadline=deadline),
+                                       *(self._getrequest(link, errormessage=None, deadline=deadline)
+                                         for link in links[1:]))
+        loop = asyncio.get_running_loop()
+        # Parsing persists the result of the check, so it runs off the event loop along with the mirror health
+        cloudversion, whatsnew = await loop.run_in_executor(None, self._parseupdateinfo,
+                                                            dict(zip(links, results)), errormessage)
+        await loop.run_in_executor(None, self._savemirrors)
+        self._reportcheck(start, cloudversion)
+        return cloudversion, whatsnew
+
+    async def getupdateinfo(self) -> UpdateInfo:
+        """
+        Checks for updates to the current script on remote github repository without interacting with the user.
+        If the check fails, returns None
+        """
+        cloudversion, whatsnew = await self._fetchupdateinfo(errormessage=None)
+        if cloudversion is None:
+            return None
+        return UpdateInfo(cloudversion, whatsnew, self._updateavailable(cloudversion))
+
+    def checkinbackground(self, callback: "Callable[[UpdateInfo], None]"=None,
+                          deadline: float=5) -> "asyncio.Task":
+        """
+        Checks for updates to the current script on remote github repository in a task on the running event loop,
+        so the check runs alongside the rest of the program.
+        Does not interact with the user.
+
+        :param callback: Function to call with the UpdateInfo once the check is done
+        (or with None if the check fails or misses the deadline)
+        :param deadline: Number of seconds the check is allowed to take. If deadline is None, the check is only
+        bounded by timeout
+        :return: Task that resolves to the UpdateInfo, or raises if the check fails or misses the deadline
+        """
+        import asyncio
+        task = asyncio.get_running_loop().create_task(asyncio.wait_for(self.getupdateinfo(), deadline))
+        if callback is not None:
+            task.add_done_callback(
+                lambda done: callback(None if done.cancelled() or done.exception() else done.result()))
+        return task
+
+    def reportupdate(self, task: "asyncio.Task") -> UpdateInfo:
+        """
+        Tells the user about an available update found by checkinbackground.
+        Does not prompt the user, so it is safe to call at exit. Unlike UpdateHandler.reportupdate, it takes no
+        deadline and never waits for the check to finish, since blocking would stall the event loop the check
+        runs on (await the task first to wait for it)
+
+        :param task: Task returned by checkinbackground
+        :return: The UpdateInfo, or None if the check failed or is not done
+        """
+        if not task.done() or task.cancelled() or task.exception() is not None:
+            return None
+        info = task.result()
+        if info is not None and info.updateavailable:
+            self._announceupdate(info)
+        return info
+
+    async def getmanifest(self, errormessage: str=None) -> dict:
+        """
+        Gets and verifies the manifest at manifestlink
+
+        :param errormessage: Error message to print if request fails. If errormessage is None,
+        no error messages will be printed
+        :raises aiohttp.ClientError: If http request to remote github repository fails
+        :raises IntegrityError: If the manifest is malformed or its signature is invalid
+        """
+        success, text = await self._getrequest(self.manifestlink, errormessage=errormessage)
+        if not success:
+            raise self._requestfailure(f"Request to {self.manifestlink} failed.")
+        return _parsemanifest(text, self.publickey)
+
+    async def update(self, version: str=None) -> str:
+        """
+        Edits current script to latest version on remote github repository.
+        The script is streamed to a temporary file next to the current script, which then atomically replaces
+        it, so the current script is never left partially written.
+        If manifestlink is specified, the script is downloaded from the manifest's links (trying each in turn)
+        and verified against the manifest before it is installed. Deltas are used like in UpdateHandler.update.
+        Like UpdateHandler.update, only one process at a time can update the script. The lock is waited for on a
+        worker thread, so the event loop keeps running.
+        Changes will be applied on next run.
+
+        :param version: The version being installed. Defaults to the manifest's version, if there is one
+        :return: The sha256 hex digest of the installed script
+        :raises aiohttp.ClientError: If http request to remote github repository fails
+        :raises IntegrityError: If the manifest or the downloaded script fails verification
+        :raises TimeoutError: If another process is still updating the script after locktimeout seconds
+        """
+        import asyncio
+        loop = asyncio.get_running_loop()
+        with self._reportoutcome("update", version=version) as outcome:
+            manifest, self._manifest = self._manifest, None
+            if manifest is None and self.manifestlink:
+                manifest = await self.getmanifest()
+            if version is None and manifest is not None:
+                version = outcome["version"] = manifest.get("version")
+            lock = FileLock(self.lockpath)
+            if not await loop.run_in_executor(None, self._acquirelock, lock):
+                return await loop.run_in_executor(None, self._lockbusy, version, outcome)
+            try:
+                digest = await loop.run_in_executor(None, self._installedby, version)
+                if digest is None:
+                    digest = await self._install(manifest)
+                    await loop.run_in_executor(None, self._recordinstall, digest, version)
+                    outcome["outcome"] = "installed"
+                else:
+                    outcome["outcome"] = "alreadyinstalled"
+            finally:
+                lock.release()
+                await loop.run_in_executor(None, self._savemirrors)
+        return digest
+
+    async def _install(self, manifest: dict) -> str:
+        """
+        Utility function to download the script and atomically install it
+
+        :param manifest: Manifest to take the script's links from and verify the script against (may be None)
+        :return: The sha256 hex digest of the installed script
+        """
+        import asyncio
+        import aiohttp
+        self._checkverifiable(manifest)
+        start = time.perf_counter()
+        timings = {}
+        delta = self._deltafor(manifest)
+        if delta is not None:
+            try:
+                async with (await self._timedget(delta["link"]))[0] as response:
+                    patch = await response.read() if response.status == 200 else None
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                patch = None
+            if patch is not None:
+                digest = await asyncio.get_running_loop().run_in_executor(None, self._installdelta, manifest, delta,
+                                                                          patch, timings)
+                if digest is not None:
+                    self._reportinstall("delta", start, timings)
+                    return digest
+        partpath = self.scriptpath + self._PARTSUFFIX
+        digest = await self._downloadany(self._scriptlinks(manifest), partpath)
+        await asyncio.get_running_loop().run_in_executor(None, self._commitpart, partpath, self.scriptpath,
+                                                         manifest, digest, timings)
+        self._reportinstall("full", start, timings)
+        return digest
+
+    async def updatefiles(self, maxworkers: int=None) -> dict:
+        """
+        Updates every file of a project listed in the manifest's files to its latest version.
+        Works like UpdateHandler.updatefiles, with the downloads running concurrently on the event loop, and
+        verifying, swapping in and compiling the files running on worker threads.
+
+        :param maxworkers: Maximum number of concurrent downloads. Defaults to poolsize
+        :return: Dict mapping the path of each updated file to its sha256 hex digest
+        :raises aiohttp.ClientError: If http request to remote github repository fails
+        :raises IntegrityError: If the manifest or a downloaded file fails verification
+        :raises TimeoutError: If another process is still updating the project after locktimeout seconds
+        """
+        import asyncio
+        with self._reportoutcome("update", version=None) as outcome:
+            manifest, self._manifest = self._manifest, None
+            if manifest is None:
+                manifest = await self.getmanifest()
+            outcome["version"] = manifest.get("version")
+            files = self._plannedfiles(manifest)
+            loop = asyncio.get_running_loop()
+            lock = FileLock(self.lockpath)
+            if not await loop.run_in_executor(None, self._acquirelock, lock):
+                raise TimeoutError(f"Another process is still updating {self.scriptname}")
+            try:
+                await loop.run_in_executor(None, self._recoverfiles)
+                unchanged = await asyncio.gather(*(loop.run_in_executor(None, self._isunchanged, file)
+                                                   for file in files))
+                changed = [file for file, isunchanged in zip(files, unchanged) if not isunchanged]
+                semaphore = asyncio.Semaphore(maxworkers or self.poolsize)
+
+                async def fetch(file):
+                    async with semaphore:
+                        await self._fetchobject(file)
+
+                await asyncio.gather(*(fetch(file) for file in self._uniqueobjects(changed)))
+                await loop.run_in_executor(None, self._installfiles, changed)
+            finally:
+                lock.release()
+                await loop.run_in_executor(None, self._savemirrors)
+        return self._updatedfiles(changed, outcome)
+
+    async def _fetchobject(self, file: dict) -> None:
+        """
+        Utility function to download a file into objectsdir and verify it, unless it is already there
+        """
+        import asyncio
+        objectpath = self._objectpath(file["sha256"])
+        if os.path.isfile(objectpath):
+            return
+        loop = asyncio.get_running_loop()
+        lock = await loop.run_in_executor(None, self._lockobject, file)
+        try:
+            if os.path.isfile(objectpath):
+                return
+            partpath = objectpath + self._PARTSUFFIX
+            await self._downloadany([file["link"]], partpath)
+            await loop.run_in_executor(None, self._commitobject, partpath, objectpath, file)
+        finally:
+            lock.release()
+
+    async def _download(self, link: str, partpath: str, chunksize: int=64 * 1024, progress: dict=None) -> str:
+        """
+        Utility function to stream the response to an http get request into a staging file, hashing it on the fly
+        Works like UpdateHandler._download, resuming an interrupted download of the same link, or revalidating
+        the cached copy
+
+        :param link: Link to make request to
+        :param partpath: Path of the staging file to write the response body to
+        :param chunksize: Maximum number of bytes to read at a time
+        :param progress: Dict to set "started" in once the response body starts being written
+        :return: The sha256 hex digest of the whole response body
+        :raises aiohttp.ClientError: If the request fails
+        """
+        import asyncio
+        import hashlib
+        loop = asyncio.get_running_loop()
+        digest = hashlib.sha256()
+        headers, offset, cached = await loop.run_in_executor(None, self._downloadheaders, link, partpath)
+        response, start, ttfb = await self._timedget(link, headers=headers, stream=True)
+        size = 0
+        async with response:
+            if response.status == 304 and cached is not None:
+                self._reportrequest(link, 304, start, ttfb, 0)
+                await loop.run_in_executor(None, self._copycached, link, cached, partpath, digest, chunksize)
+                return digest.hexdigest()
+            # Resuming re-hashes the bytes already on disk
+            mode = await loop.run_in_executor(None, self._partmode, link, partpath, response.status,
+                                              response.headers, offset, digest)
+            if mode is None:
+                self._reportrequest(link, response.status, start, ttfb, 0)
+                raise self._requestfailure(f"Request to {link} failed.")
+            if progress is not None:
+                progress["started"] = True
+            try:
+                with open(partpath, mode) as f:
+                    async for chunk in response.content.iter_chunked(chunksize):
+                        digest.update(chunk)
+                        f.write(chunk)
+                        size += len(chunk)
+            except Exception as err:
+                self._reportrequest(link, response.status, start, ttfb, size, error=str(err))
+                raise
+            self._reportrequest(link, response.status, start, ttfb, size)
+            await loop.run_in_executor(None, self._finishdownload, link, partpath, response.headers, response.charset)
+        return digest.hexdigest()
+
+    async def _downloadany(self, links: list, partpath: str) -> str:
+        """
+        Utility function to stream the first of links (or of their mirrors) that can be downloaded into a staging file
+        Works like UpdateHandler._downloadany
+
+        :param links: Links to try, in order of preference
+        :param partpath: Path of the staging file to write the response body to
+        :return: The sha256 hex digest of the response body
+        :raises aiohttp.ClientError: If every link fails
+        :raises asyncio.TimeoutError: If every link fails and the last one timed out
+        """
+        import asyncio
+        import aiohttp
+        links = list(dict.fromkeys(mirrorlink for link in links for mirrorlink in self._mirrorlinks(link)))
+        for index, link in enumerate(links):
+            resumes = 0
+            while True:
+                progress = {}
                 try:
-                    self.disableupdatechecking()
-                except Exception as err:
-                    print("Failed to permanently disable update checking: " + str(err))
+                    return await self._download(link, partpath, progress=progress)
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    if self._shouldresume(progress, resumes):
+                        resumes += 1
+                        continue
+                    self._recordmirror(link, failed=True)
+                    if index == len(links) - 1:
+                        raise
+                    break
+
+    async def askuser(self, prompt: str) -> bool:
+        """
+        Asks the user a Y/N question with input() on a worker thread, so the event loop keeps running
+
+        :param prompt: Question to ask
+        :return: Whether the user answered yes
+        """
+        import asyncio
+        answer = await asyncio.get_running_loop().run_in_executor(None, input, prompt)
+        return answer.strip().lower() == "y"
+
+    async def confirmcheck(self) -> bool:
+        """
+        Decides whether to check for updates (used by updatedialog)
+        """
+        return await self.askuser(f"{self.scriptname}: Would you like to check for updates? (Y/N):")
+
+    async def confirmdisable(self) -> bool:
+        """
+        Decides whether to permanently disable update checking (used by updatedialog)
+        """
+        return await self.askuser("Would you like to permanently disable update checking? (Y/N):")
+
+    async def confirmupdate(self, info: UpdateInfo) -> bool:
+        """
+        Decides whether to install an available update (used by checkforupdates)
+
+        :param info: The available update
+        """
+        return await self.askuser("Would you like to update? (Y/N):")
+
+    async def confirmignore(self, info: UpdateInfo) -> bool:
+        """
+        Decides whether to permanently ignore an available update that was not installed (used by checkforupdates)
+
+        :param info: The available update
+        """
+        return await self.askuser("Would you like to permanently ignore this version? (Y/N):")
+
+    async def checkforupdates(self, silentlyfail=True) -> None:
+        """
+        Checks for updates to the current script on remote github repository.
+        Decides what to do via the confirmupdate and confirmignore hooks
+        Changes will be applied on next run.
+
+        :param silentlyfail: Whether to alert the user if the program fails to check for updates or silently fail
+
+        Has the same possible outcomes as UpdateHandler.checkforupdates
+
+        :raises sys.exit: If changes to script are made
+        """
+        errormessage = None if silentlyfail else f"{self.scriptname}: Unable to check for updates"
+        cloudversion, whatsnew = await self._fetchupdateinfo(errormessage)
+        if cloudversion is not None:
+            info = UpdateInfo(cloudversion, whatsnew, self._updateavailable(cloudversion))
+            if info.updateavailable:
+                self._announceupdate(info, explainmissing=True)
+                if await self.confirmupdate(info):
                     try:
-                        self._checkcorrupted(currentcode)
-                    except Exception:
-                        pass
-                else:
-                    print(f"Successfully disabled update checking! Rerun {self.scriptname}")
-                    sys.exit()
+                        await self.update(cloudversion)
+                    except Exception as err:
+                        print("Update failed: " + str(err))
+                    else:
+                        print(f"Successfully updated {self.scriptname}! Rerun the script.")
+                        sys.exit()
+                elif await self.confirmignore(info):
+                    self._ignoreversionverbosely(cloudversion)
+            else:
+                print("No updates found")
+
+    async def updatedialog(self):
+        """
+        Decides whether to check for updates via the confirmcheck hook.
+        If yes, calls checkforupdates() function.
+        Otherwise, decides whether to disable update checking via the confirmdisable hook.
+        Changes will be applied on next run.
+
+        Has the same possible outcomes as UpdateHandler.updatedialog
+
+        :raises sys.exit: If changes to script are made
+        """
+        if not self.updatecheckingenabled():
+            return
+        if await self.confirmcheck():
+            await self.checkforupdates(silentlyfail=False)
+        elif await self.confirmdisable():
+            self._disableupdatecheckingverbosely()
+
+
+def checkmany(targets: list, maxworkers: int=64, cache: ResponseCache=None, observers: list=None) -> list:
+    """
+    Checks many scripts for updates at once, without interacting with the user.
+    Every request is made concurrently, and a link shared by several targets is only requested once,
+    so checking many targets takes about as long as checking one.
+
+    :param targets: UpdateHandlers, or dicts of UpdateHandler parameters (give each one a scriptname and
+    currentversion). Handlers created from dicts share one connection pool of maxworkers connections per host
+    :param maxworkers: Maximum number of concurrent requests
+    :param cache: ResponseCache for handlers created from dicts, so unchanged version files and manifests are
+    revalidated instead of downloaded again
+    :param observers: Observers for handlers created from dicts (see UpdateHandler)
+    :return: List with a dict for each target, in order, with its scriptname, repolink, currentversion,
+    cloudversion, whatsnew, updateavailable and whether the check succeeded (checked)
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    start = time.perf_counter()
+    session = None
+    handlers = []
+    for target in targets:
+        if isinstance(target, AsyncUpdateHandler):
+            raise TypeError("checkmany does not support AsyncUpdateHandler")
+        if not isinstance(target, UpdateHandler):
+            if session is None:
+                session = UpdateHandler.makesession(maxworkers)
+            target = UpdateHandler(**{"session": session, "cache": cache, "observers": observers, **target})
+        handlers.append(target)
+    checks = []
+    owners = {}
+    for handler in handlers:
+        throttled = handler._throttledinfo()
+        links = handler._checklinks() if throttled is None else []
+        for link in links:
+            owners.setdefault(link, handler)
+        checks.append((handler, throttled, links))
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(maxworkers, len(owners)))) as executor:
+            pending = {link: executor.submit(owner._getrequest, link) for link, owner in owners.items()}
+            responses = {link: request.result() for link, request in pending.items()}
+    finally:
+        if session is not None:
+            session.close()
+    report = []
+    for handler, throttled, links in checks:
+        if throttled is not None:
+            cloudversion, whatsnew = throttled
+        else:
+            cloudversion, whatsnew = handler._parseupdateinfo({link: responses[link] for link in links})
+            handler._savemirrors()
+        handler._reportcheck(start, cloudversion, throttled=throttled is not None)
+        report.append({"scriptname": handler.scriptname, "repolink": handler.repolink,
+                       "currentversion": handler.currentversion, "cloudversion": cloudversion,
+                       "whatsnew": whatsnew, "checked": cloudversion is not None,
+                       "updateavailable": cloudversion is not None and handler._updateavailable(cloudversion)})
+    return report
+
+
+def main(argv: list=None) -> int:
+    """
+    Command line entry point, which checks the scripts listed in a json file for updates with checkmany
+    and prints the report as json.
+
+    :return: Exit status: 10 if any script has an update, otherwise 0 (1 is left to uncaught exceptions and 2 to
+    argparse usage errors, so a failed check is never mistaken for an available update)
+    """
+    import argparse
+    parser = argparse.ArgumentParser(prog="PythonAutoUpdate",
+                                     description="Check many scripts for updates at once.")
+    parser.add_argument("targets", help="json file with a list of UpdateHandler parameters for each script")
+    parser.add_argument("--maxworkers", type=int, default=64, help="maximum number of concurrent requests")
+    parser.add_argument("--cachedir", help="directory to cache responses in (responses are not cached if omitted)")
+    args = parser.parse_args(argv)
+    with open(args.targets, 'r') as f:
+        targets = json.load(f)
+    cache = ResponseCache(args.cachedir) if args.cachedir else None
+    report = checkmany(targets, maxworkers=args.maxworkers, cache=cache)
+    print(json.dumps(report, indent=2))
+    return 10 if any(entry["updateavailable"] for entry in report) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
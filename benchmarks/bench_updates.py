@@ -0,0 +1,293 @@
+"""
+Benchmarks UpdateHandler's update checks, updates and integrity checks against a local stand-in for GitHub, so
+performance changes can be judged against a baseline without a network connection.
+
+Usage: python benchmarks/bench_updates.py [--runs N] [--latency SECONDS] [--sizes BYTES ...] [--processes N]
+                                          [--save results.json] [--baseline results.json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+import tracemalloc
+
+BENCHDIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCHDIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCHDIR)
+
+import PythonAutoUpdate
+from server import FakeGitHub
+
+# Run by each process of the concurrent update benchmark
+UPDATEPROCESS = """
+import sys, json
+sys.path.insert(0, {root!r})
+import PythonAutoUpdate
+kwargs = json.loads(sys.argv[1])
+with PythonAutoUpdate.UpdateHandler(**kwargs) as updatehandler:
+    updatehandler.update()
+"""
+
+
+class Bench:
+    """
+    Runs the benchmarks in a scratch directory and collects their results
+
+    :param runs: Number of times each timed operation is repeated
+    :param directory: Scratch directory for scripts, state, settings and caches
+    """
+    def __init__(self, runs: int, directory: str):
+        self.runs = runs
+        self.directory = directory
+        self.results = {}
+        self._counter = 0
+
+    def scratch(self, name: str) -> str:
+        """
+        Gets a fresh path in the scratch directory
+        """
+        self._counter += 1
+        return os.path.join(self.directory, f"{self._counter}-{name}")
+
+    def handler(self, server: FakeGitHub, manifest: bool=False, **kwargs) -> PythonAutoUpdate.UpdateHandler:
+        """
+        Creates an UpdateHandler pointing at server, with its own state and settings files
+        """
+        params = server.handlerkwargs(manifest=manifest)
+        params.update(statefile=self.scratch("state.json"), settingsfile=self.scratch("settings.json"),
+                      scriptpath=self.scratch(server.scriptname), objectsdir=self.scratch("objects"),
+                      currentversion="1.0.0")
+        params.update(kwargs)
+        return PythonAutoUpdate.UpdateHandler(**params)
+
+    def record(self, name: str, timings: list=None, **extra) -> None:
+        """
+        Records the median of timings (in seconds) under name, with any extra figures, and prints them
+        """
+        result = {}
+        if timings:
+            result = {"median_ms": statistics.median(timings) * 1000, "min_ms": min(timings) * 1000}
+        result.update(extra)
+        self.results[name] = result
+        details = "  ".join(f"{key}={value:.4g}" if isinstance(value, float) else f"{key}={value}"
+                            for key, value in extra.items())
+        times = f"{result['median_ms']:>10.2f}{result['min_ms']:>10.2f}" if timings else f"{'':>20}"
+        print(f"{name:<44}{times}  {details}")
+
+    def timed(self, function, setup=None) -> list:
+        """
+        Times function runs times, calling setup (untimed) before each run
+        """
+        timings = []
+        for _ in range(self.runs):
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - start)
+        return timings
+
+    def checks(self, latency: float) -> None:
+        """
+        Times cold checks (new connection, nothing cached), warm checks (pooled connection, 304 responses) and
+        throttled checks (decided from the state file)
+        """
+        with FakeGitHub(latency=latency) as server:
+            for manifest in (False, True):
+                mode = "manifest" if manifest else "version+whatsnew"
+
+                def cold():
+                    with self.handler(server, manifest=manifest) as updatehandler:
+                        assert updatehandler.getupdateinfo() is not None
+
+                server.resetcounts()
+                timings = self.timed(cold)
+                self.record(f"cold check ({mode})", timings,
+                            requests=sum(server.requests.values()) // self.runs)
+
+                cache = PythonAutoUpdate.ResponseCache(self.scratch("cache"))
+                updatehandler = self.handler(server, manifest=manifest, cache=cache)
+                updatehandler.getupdateinfo()
+                server.resetcounts()
+                timings = self.timed(lambda: updatehandler.getupdateinfo())
+                self.record(f"warm check, cached ({mode})", timings,
+                            requests=sum(server.requests.values()) // self.runs,
+                            bytes=server.bytessent // self.runs)
+                updatehandler.close()
+
+            updatehandler = self.handler(server, checkinterval=3600)
+            updatehandler.getupdateinfo()
+            server.resetcounts()
+            timings = self.timed(lambda: updatehandler.getupdateinfo())
+            self.record("throttled check", timings, requests=sum(server.requests.values()) // self.runs)
+            updatehandler.close()
+
+    def failures(self, failurerate: float) -> None:
+        """
+        Times checks against a server that fails some of the requests
+        """
+        with FakeGitHub(failurerate=failurerate) as server:
+            updatehandler = self.handler(server)
+            succeeded = []
+            timings = self.timed(lambda: succeeded.append(updatehandler.getupdateinfo() is not None))
+            self.record(f"check with {failurerate:.0%} failures", timings,
+                        succeeded=f"{sum(succeeded)}/{len(succeeded)}")
+            updatehandler.close()
+
+    def failover(self) -> None:
+        """
+        Times checks when the first mirror is down: the first check fails over to the second mirror, and later
+        checks go to the second mirror first
+        """
+        with FakeGitHub(failurerate=1) as down, FakeGitHub() as up:
+            updatehandler = self.handler(down, mirrors=[down.baselink, up.baselink], retries=0)
+            start = time.perf_counter()
+            assert updatehandler.getupdateinfo() is not None
+            self.record("check, first mirror down", [time.perf_counter() - start])
+            down.resetcounts()
+            timings = self.timed(lambda: updatehandler.getupdateinfo())
+            self.record("check, first mirror down, remembered", timings,
+                        requests_to_down_mirror=sum(down.requests.values()))
+            updatehandler.close()
+
+    def updates(self, size: int) -> None:
+        """
+        Times update() (plain, verified against a manifest, and precompiled) and checkintegrity() for a script of
+        size bytes, and measures the peak memory of update()
+        """
+        label = f"{size / 1024:.0f}KB" if size < 1024 * 1024 else f"{size / 1024 / 1024:.0f}MB"
+        with FakeGitHub(scriptsize=size) as server:
+            for manifest, precompile, mode in ((False, False, ""), (True, False, ", verified"),
+                                               (True, True, ", precompiled")):
+                updatehandler = self.handler(server, manifest=manifest, precompile=precompile)
+
+                def reset():
+                    # Start each run from an out of date script, so the whole script is downloaded
+                    with open(updatehandler.scriptpath, 'wb') as f:
+                        f.write(b"")
+
+                timings = self.timed(updatehandler.update, setup=reset)
+                self.record(f"update {label}{mode}", timings,
+                            mb_per_s=size / 1024 / 1024 / statistics.median(timings))
+                updatehandler.close()
+
+            updatehandler = self.handler(server, manifest=True)
+            updatehandler.update()
+            timings = self.timed(lambda: updatehandler.checkintegrity())
+            self.record(f"checkintegrity {label}", timings,
+                        mb_per_s=size / 1024 / 1024 / statistics.median(timings))
+
+            with open(updatehandler.scriptpath, 'wb') as f:
+                f.write(b"")
+            tracemalloc.start()
+            updatehandler.update()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            self.record(f"update {label} peak memory", peak_kb=peak / 1024)
+            updatehandler.close()
+
+    def transfers(self, size: int) -> None:
+        """
+        Times updates of a script of size bytes from a server that compresses responses, and from servers that
+        drop every connection partway through (after a third of the script, and within the first 64KB read), and
+        counts how many bytes went over the wire
+        """
+        label = f"{size / 1024:.0f}KB" if size < 1024 * 1024 else f"{size / 1024 / 1024:.0f}MB"
+        for name, options in (("compressed", {"compress": True}), ("flaky link", {"dropafter": size // 3}),
+                              ("flaky link, 16KB per connection", {"dropafter": 16 * 1024})):
+            # Enough retries for every resume the download needs
+            retries = size // options["dropafter"] + 1 if "dropafter" in options else 2
+            with FakeGitHub(scriptsize=size, **options) as server:
+                updatehandler = self.handler(server, manifest=True, retries=retries, backoff=0.01)
+
+                def reset():
+                    with open(updatehandler.scriptpath, 'wb') as f:
+                        f.write(b"")
+                    server.resetcounts()
+
+                sent = []
+                timings = self.timed(lambda: (updatehandler.update(), sent.append(server.bytessent)), setup=reset)
+                self.record(f"update {label}, {name}", timings, kb_sent=statistics.median(sent) / 1024,
+                            requests=server.requests.get(server.scriptname, 0))
+                updatehandler.close()
+
+    def concurrent(self, processes: int, size: int) -> None:
+        """
+        Times processes processes updating the same script at the same time, and counts how often the script
+        was downloaded
+        """
+        with FakeGitHub(scriptsize=size) as server:
+            params = server.handlerkwargs(manifest=True)
+            params.update(statefile=self.scratch("state.json"), settingsfile=self.scratch("settings.json"),
+                          scriptpath=self.scratch(server.scriptname), objectsdir=self.scratch("objects"),
+                          currentversion="1.0.0")
+            code = UPDATEPROCESS.format(root=ROOT)
+            timings = []
+            downloads = []
+            for _ in range(self.runs):
+                with open(params["scriptpath"], 'wb') as f:
+                    f.write(b"")
+                server.resetcounts()
+                start = time.perf_counter()
+                running = [subprocess.Popen([sys.executable, "-c", code, json.dumps(params)])
+                           for _ in range(processes)]
+                failed = sum(process.wait() != 0 for process in running)
+                timings.append(time.perf_counter() - start)
+                downloads.append(server.requests.get(server.scriptname, 0))
+                if failed:
+                    print(f"{failed} of {processes} processes failed")
+            self.record(f"{processes} processes updating at once", timings,
+                        script_downloads=max(downloads))
+
+
+def compare(results: dict, baseline: dict) -> None:
+    """
+    Prints how each median changed against a baseline
+    """
+    print(f"\n{'benchmark':<44}{'baseline':>10}{'now':>10}{'change':>10}")
+    for name, result in results.items():
+        for key in ("median_ms", "peak_kb"):
+            before, now = baseline.get(name, {}).get(key), result.get(key)
+            if before and now is not None:
+                unit = "KB" if key == "peak_kb" else "ms"
+                print(f"{name:<44}{before:>8.2f}{unit}{now:>8.2f}{unit}{(now - before) / before:>+10.1%}")
+
+
+def main(argv: list=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10, help="number of runs per benchmark")
+    parser.add_argument("--latency", type=float, default=0.02,
+                        help="seconds of latency injected into each response for the check benchmarks")
+    parser.add_argument("--failurerate", type=float, default=0.3,
+                        help="fraction of failed requests for the failure benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[64 * 1024, 1024 * 1024, 16 * 1024 * 1024],
+                        help="script sizes in bytes for the update benchmarks")
+    parser.add_argument("--processes", type=int, default=8, help="number of processes updating at once")
+    parser.add_argument("--save", help="file to save the results to")
+    parser.add_argument("--baseline", help="results file saved by an earlier run to compare against")
+    args = parser.parse_args(argv)
+    with tempfile.TemporaryDirectory() as directory:
+        bench = Bench(args.runs, directory)
+        print(f"{'benchmark':<44}{'median ms':>10}{'min ms':>10}")
+        bench.checks(args.latency)
+        bench.failures(args.failurerate)
+        bench.failover()
+        for size in args.sizes:
+            bench.updates(size)
+        bench.transfers(args.sizes[len(args.sizes) // 2])
+        bench.concurrent(args.processes, args.sizes[len(args.sizes) // 2])
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(bench.results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(bench.results, json.load(f))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
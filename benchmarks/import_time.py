@@ -0,0 +1,96 @@
+"""
+Measures how much importing PythonAutoUpdate costs, and how much a run with update checking disabled adds on
+top of starting python, to show that the http stack is only imported when a network operation happens.
+
+Usage: python benchmarks/import_time.py [--runs N]
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import statistics
+import subprocess
+import time
+import py_compile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Each scenario is run in a fresh interpreter, so nothing is already imported
+SCENARIOS = {
+    "python startup": "pass",
+    "import PythonAutoUpdate": "import PythonAutoUpdate",
+    "update checking disabled": (
+        "import PythonAutoUpdate\n"
+        "updatehandler = PythonAutoUpdate.UpdateHandler('https://github.com/user/repo', 'script.py',"
+        " settingsfile={settingsfile!r})\n"
+        "updatehandler.updatedialog()\n"
+    ),
+    "import requests (for comparison)": "import requests",
+}
+
+HEAVYMODULES = ["requests", "urllib3", "urllib.request", "http.client", "ssl", "asyncio", "concurrent.futures"]
+
+
+def timerun(code: str, runs: int) -> float:
+    """
+    Runs code in a fresh interpreter runs times and returns the median wall time in milliseconds
+    """
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def importedmodules(code: str) -> list:
+    """
+    Runs code in a fresh interpreter and returns which of HEAVYMODULES it imported
+    """
+    probe = code + f"\nimport sys, json\nprint(json.dumps([m for m in {HEAVYMODULES!r} if m in sys.modules]))"
+    output = subprocess.run([sys.executable, "-c", probe], cwd=ROOT, check=True, capture_output=True, text=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def selfimporttime() -> float:
+    """
+    Gets the cumulative import time of PythonAutoUpdate reported by python -X importtime, in milliseconds
+    """
+    output = subprocess.run([sys.executable, "-X", "importtime", "-c", "import PythonAutoUpdate"], cwd=ROOT,
+                            check=True, capture_output=True, text=True)
+    for line in output.stderr.splitlines():
+        fields = [field.strip() for field in line.split("|")]
+        if len(fields) == 3 and fields[2] == "PythonAutoUpdate":
+            return int(fields[1]) / 1000
+    return float("nan")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20, help="number of runs per scenario")
+    args = parser.parse_args()
+    # Compile the module up front so that PYTHONDONTWRITEBYTECODE doesn't turn every run into a compile benchmark
+    py_compile.compile(os.path.join(ROOT, "PythonAutoUpdate.py"), doraise=True)
+    with tempfile.TemporaryDirectory() as directory:
+        settingsfile = os.path.join(directory, "settings.json")
+        with open(settingsfile, 'w') as f:
+            json.dump({"updatechecking": False}, f)
+        baseline = None
+        print(f"{'scenario':<36}{'median ms':>10}{'vs startup':>12}  heavy modules imported")
+        for name, code in SCENARIOS.items():
+            code = code.format(settingsfile=settingsfile)
+            try:
+                median = timerun(code, args.runs)
+            except subprocess.CalledProcessError:
+                print(f"{name:<36}{'failed':>10}")
+                continue
+            if baseline is None:
+                baseline = median
+            heavy = ", ".join(importedmodules(code)) or "none"
+            print(f"{name:<36}{median:>10.1f}{median - baseline:>+12.1f}  {heavy}")
+    print(f"\npython -X importtime reports {selfimporttime():.2f} ms cumulative for PythonAutoUpdate")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""
+A local stand-in for raw.githubusercontent.com, so UpdateHandler can be benchmarked offline.
+
+Serves version.txt, whatsnew.txt, manifest.json and a script of configurable size from memory, with optional
+injected latency, ETag/Last-Modified revalidation (304 responses), range requests (206 responses), gzip
+compression, injected failures and dropped connections.
+
+Usage: python benchmarks/server.py [--port PORT] [--scriptsize BYTES] [--latency SECONDS] [--failurerate RATE]
+                                   [--compress] [--dropafter BYTES]
+"""
+import re
+import sys
+import gzip
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from email.utils import formatdate
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+REPOPATH = "/user/repo/master"
+
+
+def makescript(size: int, version: str="1.1.0") -> bytes:
+    """
+    Generates a python script of size bytes that compiles and looks like real code
+    It is made of whole functions, padded to size with a comment line (or just the version line, if that alone
+    is longer than size)
+
+    :param size: Size of the script in bytes
+    :param version: Version the script declares
+    """
+    header = f'__version__ = "{version}"\n\n'.encode()
+    body = [header]
+    length = len(header)
+    number = 0
+    while True:
+        function = f"def function{number}(value):\n    return value * {number} + {number % 7}\n\n\n".encode()
+        if length + len(function) > size:
+            break
+        body.append(function)
+        length += len(function)
+        number += 1
+    padding = size - length
+    if padding == 1:
+        body.append(b"\n")
+    elif padding > 1:
+        body.append(b"#" + b"-" * (padding - 2) + b"\n")
+    return b"".join(body)
+
+
+class FakeGitHub:
+    """
+    Serves a fake repository over http on a background thread
+
+    :param scriptname: Name of the script file served by the repository
+    :param scriptsize: Size of the served script in bytes
+    :param version: Version published in version.txt and manifest.json
+    :param latency: Number of seconds to wait before answering each request
+    :param failurerate: Fraction of requests (between 0 and 1) that are answered with a 503
+    :param conditional: Whether to answer conditional requests for unchanged files with 304 Not Modified
+    :param port: Port to listen on. If port is 0, a free port is picked
+    :param failurestatus: Status code of injected failures (503, or 429 to simulate rate limiting)
+    :param retryafter: Retry-After header to send with injected failures, if any
+    :param compress: Whether to gzip responses for clients that accept it
+    :param dropafter: Number of bytes of each response body to send before dropping the connection, to simulate a
+    flaky link. If dropafter is None, connections are never dropped
+    """
+    def __init__(self, scriptname: str="script.py", scriptsize: int=64 * 1024, version: str="1.1.0",
+                 latency: float=0, failurerate: float=0, conditional: bool=True, port: int=0,
+                 failurestatus: int=503, retryafter: str=None, compress: bool=False, dropafter: int=None):
+        self.scriptname = scriptname
+        self.latency = latency
+        self.failurerate = failurerate
+        self.conditional = conditional
+        self.failurestatus = failurestatus
+        self.retryafter = retryafter
+        self.compress = compress
+        self.dropafter = dropafter
+        self.files = {}
+        self.requests = {}
+        self.bytessent = 0
+        self._countlock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Send the headers and body of small responses together, or delayed acks add ~40ms to each
+            wbufsize = 64 * 1024
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                server._handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+        self._gzipped = {}
+        self.publish(version, makescript(scriptsize, version))
+
+    @property
+    def baselink(self) -> str:
+        """
+        Link the repository's files are served under, like https://raw.githubusercontent.com/user/repo/master
+        """
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}{REPOPATH}"
+
+    @property
+    def repolink(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}/user/repo"
+
+    def link(self, name: str) -> str:
+        return f"{self.baselink}/{name}"
+
+    def handlerkwargs(self, manifest: bool=False) -> dict:
+        """
+        Gets the UpdateHandler parameters pointing at this server
+
+        :param manifest: Whether to check for updates through manifest.json instead of version.txt and whatsnew.txt
+        """
+        kwargs = {"repolink": self.repolink, "scriptname": self.scriptname,
+                  "versionlink": self.link("version.txt"), "whatsnewlink": self.link("whatsnew.txt"),
+                  "scriptlink": self.link(self.scriptname)}
+        if manifest:
+            kwargs["manifestlink"] = self.link("manifest.json")
+        return kwargs
+
+    def publish(self, version: str, script: bytes, whatsnew: str="Made everything faster") -> None:
+        """
+        Publishes a new version of the script, changing every file's ETag
+
+        :param version: The new version
+        :param script: The new script
+        :param whatsnew: The new changelog
+        """
+        manifest = {"version": version, "whatsnew": whatsnew, "sha256": hashlib.sha256(script).hexdigest(),
+                    "size": len(script), "scriptlink": self.link(self.scriptname)}
+        files = {"version.txt": version.encode(), "whatsnew.txt": whatsnew.encode(), self.scriptname: script}
+        files["manifest.json"] = json.dumps(manifest).encode()
+        modified = formatdate(usegmt=True)
+        self.files = {name: (data, f'"{hashlib.sha256(data).hexdigest()[:16]}"', modified)
+                      for name, data in files.items()}
+
+    def resetcounts(self) -> None:
+        with self._countlock:
+            self.requests = {}
+            self.bytessent = 0
+
+    def _count(self, name: str, sent: int) -> None:
+        with self._countlock:
+            self.requests[name] = self.requests.get(name, 0) + 1
+            self.bytessent += sent
+
+    def _handle(self, request: BaseHTTPRequestHandler) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+        path = request.path.split("?", 1)[0]
+        name = path[len(REPOPATH) + 1:] if path.startswith(REPOPATH + "/") else None
+        if self.failurerate and random.random() < self.failurerate:
+            self._send(request, name, self.failurestatus, b"Service Unavailable",
+                       {"Retry-After": self.retryafter} if self.retryafter is not None else None)
+            return
+        if name not in self.files:
+            self._send(request, name, 404, b"404: Not Found")
+            return
+        data, etag, modified = self.files[name]
+        if self.conditional and (request.headers.get("If-None-Match") == etag
+                                 or (request.headers.get("If-None-Match") is None
+                                     and request.headers.get("If-Modified-Since") == modified)):
+            self._send(request, name, 304, b"", {"ETag": etag, "Last-Modified": modified})
+            return
+        headers = {"ETag": etag, "Last-Modified": modified, "Content-Type": "text/plain; charset=utf-8",
+                   "Accept-Ranges": "bytes"}
+        match = re.fullmatch(r"bytes=(\d+)-", request.headers.get("Range", ""))
+        # Like real servers, the range is ignored (and the whole file sent) if If-Range does not match
+        if match and request.headers.get("If-Range") in (None, etag, modified):
+            start = int(match.group(1))
+            if start >= len(data):
+                self._send(request, name, 416, b"", {"Content-Range": f"bytes */{len(data)}"})
+                return
+            headers["Content-Range"] = f"bytes {start}-{len(data) - 1}/{len(data)}"
+            self._send(request, name, 206, data[start:], headers)
+            return
+        if self.compress and "gzip" in request.headers.get("Accept-Encoding", ""):
+            headers["Content-Encoding"] = "gzip"
+            data = self._compressed(name, data, etag)
+        self._send(request, name, 200, data, headers)
+
+    def _compressed(self, name: str, data: bytes, etag: str) -> bytes:
+        """
+        Gets a file gzipped, compressing each version of it only the first time it is requested
+        """
+        if self._gzipped.get(name, (None,))[0] != etag:
+            self._gzipped[name] = (etag, gzip.compress(data, compresslevel=6))
+        return self._gzipped[name][1]
+
+    def _send(self, request: BaseHTTPRequestHandler, name: str, status: int, body: bytes,
+              headers: dict=None) -> None:
+        request.send_response(status)
+        for header, value in (headers or {}).items():
+            request.send_header(header, value)
+        request.send_header("Content-Length", str(len(body)))
+        request.end_headers()
+        sent = body
+        if self.dropafter is not None and len(body) > self.dropafter:
+            # Promise the whole body, but hang up partway through it
+            sent = body[:self.dropafter]
+            request.close_connection = True
+        chunksize = 64 * 1024
+        for start in range(0, len(sent), chunksize):
+            request.wfile.write(sent[start:start + chunksize])
+        self._count(name, len(sent))
+
+    def start(self) -> "FakeGitHub":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="fake github", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main(argv: list=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--scriptsize", type=int, default=64 * 1024, help="size of the served script in bytes")
+    parser.add_argument("--latency", type=float, default=0, help="seconds to wait before answering each request")
+    parser.add_argument("--failurerate", type=float, default=0, help="fraction of requests answered with a 503")
+    parser.add_argument("--failurestatus", type=int, default=503, help="status code of failed requests")
+    parser.add_argument("--retryafter", help="Retry-After header to send with failed requests")
+    parser.add_argument("--noconditional", action="store_true", help="never answer with 304 Not Modified")
+    parser.add_argument("--compress", action="store_true", help="gzip responses for clients that accept it")
+    parser.add_argument("--dropafter", type=int, help="bytes of each response to send before hanging up")
+    args = parser.parse_args(argv)
+    server = FakeGitHub(scriptsize=args.scriptsize, latency=args.latency, failurerate=args.failurerate,
+                        conditional=not args.noconditional, port=args.port, failurestatus=args.failurestatus,
+                        retryafter=args.retryafter, compress=args.compress, dropafter=args.dropafter)
+    server.start()
+    print(f"Serving {server.baselink}/{{version.txt,whatsnew.txt,manifest.json,{server.scriptname}}}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    sys.exit(main())